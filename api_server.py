@@ -0,0 +1,354 @@
+"""Async HTTP API for plan generation, Q&A and export, for clients that don't use the Streamlit UI.
+
+    uvicorn api_server:app --host 0.0.0.0 --port 8000
+
+Endpoints (the Gemini API key goes in the X-Gemini-Api-Key header, or
+GEMINI_API_KEY on the server):
+
+    POST /plans                             profile JSON -> plans and a plan_id
+    POST /plans?stream=1                    same, as NDJSON chunk events then a final plan event
+    POST /plans/{plan_id}/questions         {"question": ..., "category": ...} -> answer
+    GET  /plans/{plan_id}/export/{format}   pdf, txt, md or json
+    POST /exports                           {"plan_ids": [...], "formats": ["pdf", ...]} -> ZIP archive
+    GET  /metrics                           Prometheus text metrics
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from bulk_export import ArchiveStream
+from export_artifacts import EXPORT_FORMATS, get_export_artifacts, plan_version
+from llm_calls import CircuitOpenError, api_key_fingerprint, call_agent
+from plan_cache import MemoryPlanCache
+from plan_generation import AGENT_WORKERS, parse_profile, qa_request
+from plan_jobs import generate_for_profile
+from qa_session import QASession
+from resources import get_gemini_model
+
+# Each generation runs both agents, so this matches the agent worker pool
+MAX_CONCURRENT_GENERATIONS = int(os.environ.get("API_MAX_CONCURRENT", max(AGENT_WORKERS // 2, 1)))
+# Requests allowed to wait for a slot before new ones are turned away with 503
+MAX_QUEUED_GENERATIONS = int(os.environ.get("API_MAX_QUEUED", 4 * MAX_CONCURRENT_GENERATIONS))
+
+QA_TIMEOUT = 60
+MAX_QA_PAIRS = 50
+# Plans allowed in one POST /exports archive
+MAX_EXPORT_PLANS = int(os.environ.get("API_MAX_EXPORT_PLANS", 500))
+
+# Generated plans kept for follow-up questions and exports
+_plans = MemoryPlanCache(
+    max_entries=int(os.environ.get("API_PLAN_STORE_ENTRIES", 1000)),
+    ttl=float(os.environ.get("API_PLAN_STORE_TTL", 6 * 60 * 60)),
+)
+_blocking_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_GENERATIONS + 8, thread_name_prefix="api"
+)
+_in_flight = {}
+
+_EXPORTS_BY_EXTENSION = {extension: name for name, (_, _, extension) in EXPORT_FORMATS.items()}
+
+
+class Overloaded(Exception):
+    """Raised when the generation queue is full"""
+
+
+class AdmissionQueue:
+    """Bounded concurrency with a bounded wait queue; requests beyond both are rejected"""
+
+    def __init__(self, concurrency, max_waiting):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            # Created lazily so it binds to the server's running loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            metrics.count("api_rejections", reason="queue_full")
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._semaphore.release()
+
+
+_admission = AdmissionQueue(MAX_CONCURRENT_GENERATIONS, MAX_QUEUED_GENERATIONS)
+
+
+def _error(status, message, **headers):
+    return JSONResponse({"error": message}, status_code=status, headers=headers or None)
+
+
+def _api_key(request):
+    return request.headers.get("x-gemini-api-key") or os.environ.get("GEMINI_API_KEY")
+
+
+async def _run_blocking(function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, lambda: function(*args, **kwargs))
+
+
+async def _coalesced(key, factory):
+    """Share one in-flight result between identical concurrent requests"""
+    future = _in_flight.get(key)
+    if future is not None:
+        metrics.count("api_coalesced_requests")
+        return await asyncio.shield(future)
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        result = await factory()
+    except BaseException as e:
+        if isinstance(e, Exception):
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when no other request was waiting
+        else:
+            future.cancel()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        del _in_flight[key]
+
+
+def _generate(api_key, profile, on_chunk=None):
+    """Generate and store plans for a profile (blocking; run in the executor)"""
+    dietary_plan, fitness_plan, user_profile, errors = generate_for_profile(api_key, profile, on_chunk)
+    dietary_plan, fitness_plan = dietary_plan or {}, fitness_plan or {}
+    plan_id = None
+    status = 200
+    if not (dietary_plan or fitness_plan):
+        unavailable = any(isinstance(error, CircuitOpenError) for error in errors.values())
+        status = 503 if unavailable else 502
+    else:
+        plan_id = plan_version(dietary_plan, fitness_plan, user_profile)
+        _plans.set(plan_id, {
+            "dietary_plan": dietary_plan,
+            "fitness_plan": fitness_plan,
+            "user_profile": user_profile,
+            "qa_session": QASession(dietary_plan, fitness_plan),
+            "qa_pairs": [],
+        })
+    return status, {
+        "plan_id": plan_id,
+        "dietary_plan": dietary_plan,
+        "fitness_plan": fitness_plan,
+        "user_profile": user_profile,
+        "errors": {name: str(error) for name, error in errors.items()},
+    }
+
+
+async def create_plans(request):
+    api_key = _api_key(request)
+    if not api_key:
+        return _error(401, "A Gemini API key is required")
+    try:
+        _, profile = parse_profile(await request.json())
+    except ValueError as e:
+        return _error(400, f"Invalid profile: {e}")
+
+    key = (api_key_fingerprint(api_key), json.dumps(profile, sort_keys=True, ensure_ascii=False))
+    key = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    try:
+        await _admission.acquire()
+    except Overloaded:
+        return _error(503, "Too many plans are being generated, please retry shortly", **{"Retry-After": "5"})
+
+    if request.query_params.get("stream") not in (None, "", "0", "false"):
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def on_chunk(name, text):
+            loop.call_soon_threadsafe(chunks.put_nowait, (name, text))
+
+        # A request identical to one already in flight just receives that request's final plan
+        task = asyncio.ensure_future(
+            _coalesced(key, lambda: _run_blocking(_generate, api_key, profile, on_chunk))
+        )
+        # The slot is held until the generation finishes, even if the client disconnects first
+        task.add_done_callback(_release_when_done)
+        return StreamingResponse(_stream_plans(task, chunks), media_type="application/x-ndjson")
+
+    try:
+        status, result = await _coalesced(key, lambda: _run_blocking(_generate, api_key, profile))
+    finally:
+        _admission.release()
+    return JSONResponse(result, status_code=status)
+
+
+def _release_when_done(task):
+    if not task.cancelled():
+        task.exception()  # Retrieved here in case the client went away before the final event
+    _admission.release()
+
+
+async def _stream_plans(task, chunks):
+    """NDJSON events: {"event": "chunk", "agent", "delta"} as text arrives, then one "plan" event"""
+    def line(event):
+        return json.dumps(event, ensure_ascii=False) + "\n"
+
+    sent = {}
+
+    def delta_event(name, text):
+        delta = text[sent.get(name, 0):]
+        sent[name] = len(text)
+        return line({"event": "chunk", "agent": name, "delta": delta}) if delta else ""
+
+    while True:
+        getter = asyncio.ensure_future(chunks.get())
+        try:
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not getter.done():
+                getter.cancel()
+        if getter not in done:
+            break
+        event = delta_event(*getter.result())
+        if event:
+            yield event
+    while not chunks.empty():
+        event = delta_event(*chunks.get_nowait())
+        if event:
+            yield event
+    try:
+        status, result = task.result()
+    except Exception as e:
+        yield line({"event": "error", "error": str(e)})
+    else:
+        yield line({"event": "plan", "status": status, **result})
+
+
+async def ask_question(request):
+    api_key = _api_key(request)
+    if not api_key:
+        return _error(401, "A Gemini API key is required")
+    record = _plans.get(request.path_params["plan_id"])
+    if record is None:
+        return _error(404, "Unknown or expired plan_id")
+    try:
+        body = await request.json()
+    except ValueError as e:
+        return _error(400, f"Invalid JSON body: {e}")
+    if not isinstance(body, dict):
+        return _error(400, "The body must be a JSON object")
+    question = body.get("question")
+    category = body.get("category", "Diet")
+    if not isinstance(question, str) or not question.strip():
+        return _error(400, "A question is required")
+    if not isinstance(category, str):
+        return _error(400, "category must be a string")
+    question = question.strip()
+
+    context, qa_prompt = record["qa_session"].prompt_parts(question, category, record["qa_pairs"])
+    qa_agent, prompt = qa_request(get_gemini_model(api_key), context, qa_prompt)
+    try:
+        response = await _run_blocking(call_agent, qa_agent, prompt, stage="qa", timeout=QA_TIMEOUT)
+    except CircuitOpenError as e:
+        return _error(503, str(e), **{"Retry-After": "30"})
+    except Exception as e:
+        return _error(502, f"Could not get an answer: {e}")
+    answer = getattr(response, "content", None) or "Sorry, I couldn't generate a response at this time."
+    record["qa_pairs"] = (record["qa_pairs"] + [(question, answer)])[-MAX_QA_PAIRS:]
+    return JSONResponse({"question": question, "category": category, "answer": answer})
+
+
+async def export_plan(request):
+    record = _plans.get(request.path_params["plan_id"])
+    if record is None:
+        return _error(404, "Unknown or expired plan_id")
+    export_format = _EXPORTS_BY_EXTENSION.get(request.path_params["format"])
+    if export_format is None:
+        return _error(400, f"Format must be one of: {', '.join(_EXPORTS_BY_EXTENSION)}")
+
+    artifacts = get_export_artifacts(record["dietary_plan"], record["fitness_plan"], record["user_profile"])
+    data, mime_type, extension = await _run_blocking(artifacts.get, export_format)
+    return Response(
+        data,
+        media_type=mime_type,
+        headers={"Content-Disposition": f'attachment; filename="health_fitness_plan.{extension}"'},
+    )
+
+
+def _valid_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _closing(archive):
+    try:
+        yield from archive
+    finally:
+        archive.close()  # Stops rendering when the client goes away mid-download
+
+
+async def export_plans(request):
+    """Several stored plans as one ZIP archive, streamed as it's rendered"""
+    try:
+        body = await request.json()
+    except ValueError as e:
+        return _error(400, f"Invalid JSON body: {e}")
+    if not isinstance(body, dict):
+        return _error(400, "The body must be a JSON object")
+    plan_ids = body.get("plan_ids")
+    extensions = body.get("formats", ["pdf"])
+    if not plan_ids or not _valid_list(plan_ids):
+        return _error(400, "plan_ids must be a non-empty list of strings")
+    # The same plan asked for twice is exported once
+    plan_ids = list(dict.fromkeys(plan_ids))
+    if len(plan_ids) > MAX_EXPORT_PLANS:
+        return _error(400, f"At most {MAX_EXPORT_PLANS} plans can be exported at once")
+    if not extensions or not _valid_list(extensions) or not set(extensions) <= _EXPORTS_BY_EXTENSION.keys():
+        return _error(400, f"formats must be a list of: {', '.join(_EXPORTS_BY_EXTENSION)}")
+    records = [(plan_id, _plans.get(plan_id)) for plan_id in plan_ids]
+    missing = [plan_id for plan_id, record in records if record is None]
+    if missing:
+        return _error(404, f"Unknown or expired plan_id: {', '.join(missing)}")
+
+    # Rendering takes the shared render processes, so exports wait their turn with generations
+    try:
+        await _admission.acquire()
+    except Overloaded:
+        return _error(503, "Too many requests are being served, please retry shortly", **{"Retry-After": "5"})
+    loop = asyncio.get_running_loop()
+    documents = (
+        (plan_id, record["dietary_plan"], record["fitness_plan"], record["user_profile"])
+        for plan_id, record in records
+    )
+    # The slot is held until the archive writer stops, however the download ends
+    archive = ArchiveStream(documents, extensions, on_finished=lambda: loop.call_soon_threadsafe(_admission.release))
+    return StreamingResponse(
+        _closing(archive),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="health_fitness_plans.zip"'},
+    )
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", "queued": _admission.waiting})
+
+
+app = Starlette(routes=[
+    Route("/plans", create_plans, methods=["POST"]),
+    Route("/plans/{plan_id}/questions", ask_question, methods=["POST"]),
+    Route("/plans/{plan_id}/export/{format}", export_plan, methods=["GET"]),
+    Route("/exports", export_plans, methods=["POST"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+    Route("/healthz", health, methods=["GET"]),
+])
@@ -0,0 +1,242 @@
+"""Generate plans for a cohort of profiles without the Streamlit UI.
+
+Reads profiles from CSV or JSONL and appends one JSON line per profile to the
+output file. Profiles already written successfully are skipped on the next
+run, so an interrupted job resumes where it stopped.
+
+    python batch_generate.py profiles.csv --output plans.jsonl --concurrency 8 --export pdf
+
+With --targets-only, only the locally computed nutrition targets are written,
+without any API calls.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
+import sys
+
+from bulk_export import file_stem
+from llm_calls import configure_rate_limit
+from multi_day import generate_program, plan_length
+from nutrition import batch_targets, profile_targets
+from plan_cache import get_plan_cache
+from plan_export import create_plan_pdf, create_plan_text
+from plan_generation import (
+    DEFAULT_AGENT_TIMEOUT,
+    build_dietary_agent,
+    build_fitness_agent,
+    build_user_profile,
+    generate_plans,
+    parse_profile,
+)
+from resources import MODEL_ID, get_gemini_model
+
+# Profiles per vectorized pass when only computing targets
+TARGETS_CHUNK_SIZE = 10000
+
+
+def _row_id(row, line_number):
+    """Id for a row that couldn't be parsed: its own if it has one, else its line number"""
+    row_id = row.get("id") if isinstance(row, dict) else None
+    return str(row_id if row_id not in (None, "") else line_number)
+
+
+def _json_row(line, line_number):
+    try:
+        row = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"line {line_number}: invalid JSON ({e})") from None
+    if not isinstance(row, dict):
+        raise ValueError(f"line {line_number}: expected a JSON object")
+    return row
+
+
+def read_profiles(path):
+    """Yield (id, profile, error) for each row of a .csv or .jsonl file.
+
+    A row that can't be parsed comes with profile None and the reason as
+    error, so one bad row doesn't stop the rest of the cohort.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = enumerate(csv.DictReader(f), start=1)
+        else:
+            rows = ((line_number, line) for line_number, line in enumerate(f, start=1) if line.strip())
+        for line_number, row in rows:
+            try:
+                if isinstance(row, str):
+                    row = _json_row(row, line_number)
+                profile_id, profile = parse_profile(row, line_number)
+            except ValueError as e:
+                yield _row_id(row, line_number), None, str(e)
+            else:
+                yield profile_id, profile, None
+
+
+def read_checkpoint(output_path):
+    """Ids already completed in a previous run of the same output file"""
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial last line from an interrupted run
+                if not record.get("errors"):
+                    done.add(record["id"])
+    return done
+
+
+def write_exports(export_dir, profile_id, formats, dietary_plan, fitness_plan, user_profile):
+    """Write the per-user PDF/TXT files"""
+    if "pdf" in formats:
+        with open(os.path.join(export_dir, f"{file_stem(profile_id)}.pdf"), "wb") as f:
+            f.write(create_plan_pdf(dietary_plan, fitness_plan, user_profile).getvalue())
+    if "txt" in formats:
+        with open(os.path.join(export_dir, f"{file_stem(profile_id)}.txt"), "w", encoding="utf-8") as f:
+            f.write(create_plan_text(dietary_plan, fitness_plan, user_profile))
+
+
+async def generate_one(profile_id, profile, model, args):
+    """Generate both plans, or a multi-day program, for one profile and return its output record"""
+    # Agents keep per-run state, so each profile (or program day) gets its own pair on the shared model
+    def build_agents():
+        return build_dietary_agent(model, profile["language"]), build_fitness_agent(model, profile["language"])
+
+    targets = profile_targets(profile)
+    user_profile = build_user_profile(profile, targets)
+    # Rate limiting, 429 backoff and circuit breaking come from the shared call layer
+    options = {
+        "timeouts": {"dietary": args.timeout, "fitness": args.timeout},
+        "cache": get_plan_cache(),
+        "max_retries": args.max_retries,
+    }
+    if plan_length(profile) > 1:
+        dietary_plan, fitness_plan, errors = await asyncio.to_thread(
+            generate_program, build_agents, user_profile, profile, **options
+        )
+    else:
+        dietary_plan, fitness_plan, errors = await asyncio.to_thread(
+            generate_plans, *build_agents(), user_profile, profile, **options
+        )
+    dietary_plan, fitness_plan = dietary_plan or {}, fitness_plan or {}
+    record = {
+        "id": profile_id,
+        "profile": profile,
+        "targets": targets,
+        "errors": {name: str(error) for name, error in errors.items()},
+        "dietary_plan": dietary_plan,
+        "fitness_plan": fitness_plan,
+    }
+
+    if args.export and not record["errors"]:
+        await asyncio.to_thread(
+            write_exports, args.export_dir, profile_id, args.export, dietary_plan, fitness_plan, user_profile
+        )
+    return record
+
+
+async def run_batch(args):
+    done = read_checkpoint(args.output)
+    model = get_gemini_model(args.api_key, args.model)
+    configure_rate_limit(args.api_key, args.rate, burst=args.concurrency)
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+
+    with open(args.output, "a", encoding="utf-8") as output:
+        def write(record):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            counts["failed" if record["errors"] else "ok"] += 1
+            print(f"[{record['id']}] {'failed' if record['errors'] else 'ok'}", file=sys.stderr)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                profile_id, profile = item
+                try:
+                    record = await generate_one(profile_id, profile, model, args)
+                except Exception as e:
+                    record = {"id": profile_id, "profile": profile, "errors": {"profile": str(e)}}
+                write(record)
+
+        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        for profile_id, profile, error in read_profiles(args.input):
+            if profile_id in done:
+                counts["skipped"] += 1
+            elif error is not None:
+                write({"id": profile_id, "profile": None, "errors": {"profile": error}})
+            else:
+                await queue.put((profile_id, profile))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    return counts
+
+
+def write_targets(args):
+    """Write each profile's nutrition targets, computed in vectorized chunks; returns (written, failed)"""
+    written = failed = 0
+    rows = read_profiles(args.input)
+    with open(args.output, "w", encoding="utf-8") as output:
+        while True:
+            chunk = list(itertools.islice(rows, TARGETS_CHUNK_SIZE))
+            if not chunk:
+                return written, failed
+            for profile_id, _, error in chunk:
+                if error is not None:
+                    output.write(json.dumps({"id": profile_id, "profile": None, "errors": {"profile": error}},
+                                            ensure_ascii=False) + "\n")
+            valid = [(profile_id, profile) for profile_id, profile, error in chunk if error is None]
+            for (profile_id, profile), targets in zip(valid, batch_targets([profile for _, profile in valid])):
+                output.write(json.dumps({"id": profile_id, "profile": profile, "targets": targets},
+                                        ensure_ascii=False) + "\n")
+            written += len(valid)
+            failed += len(chunk) - len(valid)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate health and fitness plans for many profiles.")
+    parser.add_argument("input", help="profiles as .csv (lists separated by ';') or .jsonl")
+    parser.add_argument("--output", help="JSONL results file, also the resume checkpoint "
+                                         "(default plans.jsonl, or targets.jsonl with --targets-only)")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY"))
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--concurrency", type=int, default=4, help="profiles generated at once")
+    parser.add_argument("--rate", type=float, default=2.0, help="maximum Gemini calls per second")
+    parser.add_argument("--max-retries", type=int, default=5, help="retries per call on 429s and transient errors")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_AGENT_TIMEOUT,
+                        help="seconds allowed per agent, including retries")
+    parser.add_argument("--export", nargs="*", choices=["pdf", "txt"], default=[], help="per-user files to write")
+    parser.add_argument("--export-dir", default="exports")
+    parser.add_argument("--targets-only", action="store_true",
+                        help="only compute nutrition targets locally, without calling Gemini")
+    args = parser.parse_args(argv)
+    if args.output is None:
+        args.output = "targets.jsonl" if args.targets_only else "plans.jsonl"
+    if not args.api_key and not args.targets_only:
+        parser.error("a Gemini API key is required (--api-key or GEMINI_API_KEY)")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.targets_only:
+        written, failed = write_targets(args)
+        print(f"Done: targets for {written} profiles, {failed} unreadable", file=sys.stderr)
+        return 1 if failed else 0
+    if args.export:
+        os.makedirs(args.export_dir, exist_ok=True)
+    counts = asyncio.run(run_batch(args))
+    print(f"Done: {counts['ok']} generated, {counts['failed']} failed, {counts['skipped']} already done",
+          file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
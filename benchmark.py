@@ -0,0 +1,423 @@
+"""Offline benchmarks for plan generation, Q&A and export.
+
+Gemini is replaced by a deterministic local stand-in with configurable
+latency, token rate and failure rate, so no API calls are made.
+
+    python benchmark.py --sessions 8 --iterations 20 --output bench.json
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import plan_generation
+import resources
+from llm_calls import call_agent, configure_rate_limit
+from multi_day import generate_program
+from plan_cache import MemoryPlanCache
+from plan_export import create_plan_pdf, create_plan_text
+from plan_generation import (
+    build_dietary_agent,
+    build_fitness_agent,
+    build_user_profile,
+    generate_plans,
+    qa_request,
+)
+from qa_session import QASession
+
+QUESTIONS = [
+    ("Diet", "Can I swap the rice at lunch for something lower in carbs?"),
+    ("Exercise", "How many sets of squats should I do in the main workout?"),
+    ("Local Ingredients", "Where can I buy kangkung and ikan bilis near me?"),
+    ("Medical Considerations", "Is this plan safe with my blood pressure?"),
+]
+
+_WORDS = ("nasi", "ikan", "sayur", "tempe", "squats", "lunges", "stretch", "protein", "fibre", "portion",
+          "minutes", "sets", "reps", "water", "brown", "rice", "chicken", "tofu", "walk", "breathing")
+
+
+class MockResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class MockGemini:
+    """Stand-in for agno's Gemini model holding the simulated backend settings"""
+
+    def __init__(self, id="mock-gemini", api_key="mock-key", latency=0.2, tokens_per_second=2000.0,
+                 failure_rate=0.0, response_tokens=600, seed=0):
+        self.id = id
+        self.api_key = api_key
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.response_tokens = response_tokens
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self):
+        with self._lock:
+            return self._rng.random() < self.failure_rate
+
+    def render(self, prompt):
+        """Deterministic markdown plan for a prompt, split into tokens"""
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        tokens = []
+        sections = ("Breakfast", "Lunch", "Dinner", "Snacks", "Warm-up", "Main Workout", "Cool-down")
+        while len(tokens) < self.response_tokens:
+            tokens.append(f"\n## {sections[len(tokens) % len(sections)]}\n")
+            for _ in range(rng.randint(3, 6)):
+                tokens.append("- " + " ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 10))) + "\n")
+        return tokens
+
+    def render_structured(self, prompt, kind):
+        """Deterministic JSON plan in the shape the dietary or fitness agent is asked for, split into tokens"""
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        words = lambda low, high: " ".join(rng.choice(_WORDS) for _ in range(rng.randint(low, high)))
+        if kind == "dietary":
+            groups = [{
+                "name": name,
+                "time": f"{7 + 4 * i}:00",
+                "items": [
+                    {"name": words(2, 4), "portion": f"{rng.randint(1, 3)} cups", "calories": rng.randint(80, 400),
+                     "protein_g": rng.randint(2, 30), "carbs_g": rng.randint(5, 60), "fat_g": rng.randint(1, 20)}
+                    for _ in range(rng.randint(3, 6))
+                ],
+                "notes": words(6, 14),
+            } for i, name in enumerate(("Breakfast", "Lunch", "Dinner", "Snacks"))]
+            plan = {"why_this_plan_works": words(12, 24), "meals": groups, "important_considerations": [words(5, 10)]}
+        else:
+            groups = [{
+                "name": name,
+                "duration_minutes": rng.randint(5, 40),
+                "exercises": [
+                    {"name": words(1, 3), "sets": rng.randint(1, 4), "reps": str(rng.randint(8, 15)),
+                     "duration_minutes": rng.randint(2, 10), "notes": words(6, 14)}
+                    for _ in range(rng.randint(3, 6))
+                ],
+            } for name in ("Warm-up", "Main Workout", "Cool-down")]
+            plan = {"sessions": groups, "tips": [words(4, 8)]}
+        text = json.dumps(plan)
+        # Roughly four characters per token, like the markdown stand-in
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+class MockAgent:
+    """Stand-in for agno's Agent with the same run/arun surface used by the app"""
+
+    def __init__(self, model=None, instructions=None, **kwargs):
+        self.model = model
+        self.instructions = instructions or []
+        self.name = kwargs.get("name")
+
+    def _chunks(self, prompt):
+        if self.model.should_fail():
+            time.sleep(self.model.latency)
+            raise RuntimeError("503 mock backend unavailable")
+        time.sleep(self.model.latency)
+        delay = 1.0 / self.model.tokens_per_second
+        if plan_generation.DIETARY_OUTPUT_FORMAT in self.instructions:
+            tokens = self.model.render_structured(prompt, "dietary")
+        elif plan_generation.FITNESS_OUTPUT_FORMAT in self.instructions:
+            tokens = self.model.render_structured(prompt, "fitness")
+        else:
+            tokens = self.model.render(prompt)
+        for token in tokens:
+            time.sleep(delay)
+            yield MockResponse(token)
+
+    def run(self, prompt, stream=False):
+        if stream:
+            return self._chunks(prompt)
+        return MockResponse("".join(chunk.content for chunk in self._chunks(prompt)))
+
+    async def arun(self, prompt, stream=False):
+        return await asyncio.to_thread(self.run, prompt)
+
+
+@contextlib.contextmanager
+def mock_gemini():
+    """Swap agno's Agent and Gemini for the local stand-ins while benchmarking"""
+    originals = plan_generation.Agent, resources.Gemini
+    plan_generation.Agent, resources.Gemini = MockAgent, MockGemini
+    try:
+        yield
+    finally:
+        plan_generation.Agent, resources.Gemini = originals
+
+
+def make_profile(i):
+    """Deterministic synthetic profile number i"""
+    rng = random.Random(i)
+    return {
+        "age": rng.randint(18, 80),
+        "weight": round(rng.uniform(45, 120), 1),
+        "height": round(rng.uniform(145, 195), 1),
+        "sex": rng.choice(["Male", "Female"]),
+        "ethnicity": rng.choice(["Malay", "Chinese", "Indian", "Indigenous"]),
+        "activity_level": rng.choice(["Sedentary", "Lightly Active", "Moderately Active"]),
+        "dietary_preferences": rng.choice(["No Restrictions", "Halal", "Vegetarian", "Low Carb"]),
+        "food_allergies": rng.sample(["None", "Nuts", "Shellfish", "Dairy"], 1),
+        "fitness_goals": rng.choice(["Lose Weight", "Gain Muscle", "Stay Fit"]),
+        "medical_conditions": rng.sample(["None", "Diabetes", "Hypertension"], 1),
+        "region": rng.choice(["Selangor", "Penang", "Sabah"]),
+        "living_environment": rng.choice(["Urban City", "Suburban", "Rural/Kampung"]),
+        "equipment_access": ["None"],
+        "lifestyle_factors": ["Desk Job"],
+        "language": "English",
+    }
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(latencies, errors, wall_time):
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "throughput_per_s": round(len(latencies) / wall_time, 2) if wall_time else None,
+    }
+
+
+def run_concurrently(sessions, iterations, operation):
+    """Run operation(session, iteration) from `sessions` threads and time each call"""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def session_loop(session):
+        nonlocal errors
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            try:
+                ok = operation(session, iteration)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session_loop, range(sessions)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def bench_generation(model, args, cache=None, streaming=False, plan_days=1):
+    """Generate plans the way plan_jobs does, streamed through on_chunk when streaming"""
+    # Agents keep per-run state, so each generation (or program day) gets its own pair, as in the app
+    def build_agents():
+        return build_dietary_agent(model, "English"), build_fitness_agent(model, "English")
+
+    def on_chunk(name, text):
+        pass
+
+    def operation(session, iteration):
+        profile = dict(make_profile((session * args.iterations + iteration) % args.distinct_profiles),
+                       plan_days=plan_days)
+        user_profile = build_user_profile(profile)
+        if plan_days > 1:
+            _, _, errors = generate_program(
+                build_agents, user_profile, profile, cache=cache, on_chunk=on_chunk if streaming else None
+            )
+        else:
+            _, _, errors = generate_plans(
+                *build_agents(), user_profile, profile, cache=cache, on_chunk=on_chunk if streaming else None
+            )
+        return not errors
+
+    # A program is plan_days generations, so run fewer to keep the scenario's agent calls comparable
+    return run_concurrently(args.sessions, max(1, args.iterations // plan_days), operation)
+
+
+def sample_plans(model, profile):
+    user_profile = build_user_profile(profile)
+    dietary_plan = plan_generation.make_dietary_plan("".join(model.render_structured(user_profile, "dietary")))
+    fitness_plan = plan_generation.make_fitness_plan("".join(model.render_structured(user_profile, "fitness")), profile)
+    return dietary_plan, fitness_plan, user_profile
+
+
+def bench_qa(model, args):
+    sessions = {}
+
+    def operation(session, iteration):
+        if session not in sessions:
+            dietary_plan, fitness_plan, _ = sample_plans(model, make_profile(session))
+            sessions[session] = (QASession(dietary_plan, fitness_plan), [])
+        qa_session, qa_pairs = sessions[session]
+        category, question = QUESTIONS[iteration % len(QUESTIONS)]
+        agent, prompt = qa_request(model, *qa_session.prompt_parts(question, category, qa_pairs))
+        answer = call_agent(agent, prompt, stage="qa").content
+        qa_pairs.append((question, answer))
+        return True
+
+    return run_concurrently(args.sessions, args.iterations, operation)
+
+
+def bench_export(model, args, export):
+    plans = [sample_plans(model, make_profile(i)) for i in range(args.sessions)]
+
+    def operation(session, iteration):
+        export(*plans[session])
+        return True
+
+    return run_concurrently(args.sessions, args.iterations, operation)
+
+
+def measure_session_memory(model, count=50):
+    """Average bytes held by one session's plans, Q&A state and exports"""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    sessions = []
+    for i in range(count):
+        dietary_plan, fitness_plan, user_profile = sample_plans(model, make_profile(i))
+        qa_session = QASession(dietary_plan, fitness_plan)
+        qa_session.build_prompt("kangkung", "Local Ingredients")
+        sessions.append({
+            "dietary_plan": dietary_plan,
+            "fitness_plan": fitness_plan,
+            "user_profile": user_profile,
+            "qa_session": qa_session,
+            "qa_pairs": [],
+            "export_text": create_plan_text(dietary_plan, fitness_plan, user_profile),
+        })
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return used // count
+
+
+# Modules the Streamlit app and API server import on every cold start, and the stacks they defer to first use
+APP_MODULES = (
+    "bulk_export", "export_artifacts", "llm_calls", "metrics", "multi_day", "plan_cache", "plan_format",
+    "plan_generation", "plan_jobs", "qa_session", "resources", "session_store",
+)
+DEFERRED_MODULES = ("agno.agent", "agno.models.google", "plan_export", "plan_index", "plan_schema", "nest_asyncio")
+
+_STARTUP_PROBE = """
+import resource, sys
+import {modules}
+usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(usage * (1 if sys.platform == "darwin" else 1024))
+"""
+
+
+def profile_imports(modules, top=10):
+    """Cold-import modules in a fresh interpreter under -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _STARTUP_PROBE.format(modules=", ".join(modules))],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((name.rstrip(), int(cumulative)))
+    top_level = [(name.strip(), micros) for name, micros in imports if not name.startswith("  ")]
+    return {
+        "import_s": round(sum(micros for _, micros in top_level) / 1e6, 3),
+        "max_rss_bytes": int(completed.stdout.strip().splitlines()[-1]),
+        "slowest": [
+            {"module": name, "cumulative_ms": round(micros / 1000, 1)}
+            for name, micros in sorted(top_level, key=lambda item: -item[1])[:top]
+        ],
+    }
+
+
+def bench_startup():
+    """Cold-start cost of the app modules alone and with the deferred agent/export stacks"""
+    return {
+        "app": profile_imports(("streamlit",) + APP_MODULES),
+        "app_with_deferred": profile_imports(("streamlit",) + APP_MODULES + DEFERRED_MODULES),
+    }
+
+
+def run_benchmarks(args):
+    model = MockGemini(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        failure_rate=args.failure_rate,
+        response_tokens=args.response_tokens,
+        seed=args.seed,
+    )
+    configure_rate_limit(model.api_key, args.rate_limit, burst=max(int(args.rate_limit), 1))
+    results = {}
+    with mock_gemini():
+        if "generation" in args.scenarios:
+            results["generation"] = bench_generation(model, args)
+            results["generation_cached"] = bench_generation(model, args, cache=MemoryPlanCache())
+            # The paths the app and API ship: background jobs streaming each agent's output, and programs
+            results["generation_streaming"] = bench_generation(model, args, streaming=True)
+            results["generation_multi_day"] = bench_generation(
+                model, args, streaming=True, plan_days=args.program_days
+            )
+        if "qa" in args.scenarios:
+            results["qa"] = bench_qa(model, args)
+        if "export" in args.scenarios:
+            results["export_pdf"] = bench_export(model, args, create_plan_pdf)
+            results["export_text"] = bench_export(model, args, create_plan_text)
+        if "memory" in args.scenarios:
+            results["memory"] = {"bytes_per_session": measure_session_memory(model)}
+    if "startup" in args.scenarios:
+        results["startup"] = bench_startup()
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app against a mock Gemini backend.")
+    parser.add_argument("--scenarios", nargs="+", default=["generation", "qa", "export", "memory", "startup"],
+                        choices=["generation", "qa", "export", "memory", "startup"])
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated sessions")
+    parser.add_argument("--iterations", type=int, default=10, help="operations per session")
+    parser.add_argument("--distinct-profiles", type=int, default=8, help="profiles cycled through for generation")
+    parser.add_argument("--program-days", type=int, choices=[7, 28], default=7,
+                        help="length of the programs in the multi-day generation scenario")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--response-tokens", type=int, default=600)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=1000.0, help="calls per second allowed by the limiter")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Export the plans of a whole cohort into one ZIP archive.
+
+    python bulk_export.py plans.jsonl --output plans.zip --formats pdf txt --workers 8
+
+Reads the results written by batch_generate.py. ReportLab is CPU-bound and
+holds the GIL, so documents are rendered in a pool of processes, which scales
+with cores. Only a few documents per process are in flight at once. Each one
+is written to the archive as soon as it's ready and then dropped, so memory
+stays flat however large the cohort is. A document that fails to render is
+listed in errors.json inside the archive, and the rest are still exported.
+"""
+import argparse
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import zipfile
+
+import metrics
+from export_artifacts import EXPORT_FORMATS, render_export
+
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", os.cpu_count() or 1))
+# Documents queued per render process, enough to keep each one busy
+PENDING_PER_WORKER = 2
+# Chunks of a streamed archive buffered ahead of a slow reader
+STREAM_CHUNKS = 16
+STREAM_CHUNK_SIZE = 64 * 1024
+# Seconds a streamed archive waits for its reader to take a chunk before giving up
+STREAM_IDLE_TIMEOUT = 120
+
+ERRORS_NAME = "errors.json"
+
+_FORMATS_BY_EXTENSION = {extension: name for name, (_, _, extension) in EXPORT_FORMATS.items()}
+# PDFs are compressed already; deflating them again only costs time
+_STORED_EXTENSIONS = {"pdf"}
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Process-wide pool of EXPORT_WORKERS render processes, started on first use"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # Spawned rather than forked: forking the API server or app while its threads run can deadlock
+            _render_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _render_pool
+
+
+def _discard_render_pool(pool):
+    """Drop the shared pool once a crashed process has broken it, so the next export starts a new one"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not pool:
+            return
+        _render_pool = None
+    pool.shutdown(wait=False)
+
+
+def file_stem(profile_id):
+    """profile_id made safe to use as a file name inside the archive"""
+    return re.sub(r"[^\w.-]+", "_", str(profile_id)).strip("._") or "plan"
+
+
+def unique_stem(profile_id, used):
+    """file_stem(profile_id), with a -2, -3, ... suffix if an earlier user already has it; adds it to used"""
+    stem = candidate = file_stem(profile_id)
+    suffix = 1
+    while candidate in used:
+        suffix += 1
+        candidate = f"{stem}-{suffix}"
+    used.add(candidate)
+    return candidate
+
+
+def render_files(stem, dietary_plan, fitness_plan, user_profile, extensions):
+    """Render one user's documents, named stem.<extension> (run in a render process).
+
+    Returns ([(file name, bytes)], [(file name, error)], seconds), so one
+    failed format doesn't lose the others.
+    """
+    start = time.perf_counter()
+    files, errors = [], []
+    for extension in extensions:
+        name = f"{stem}.{extension}"
+        try:
+            data = render_export(_FORMATS_BY_EXTENSION[extension], dietary_plan, fitness_plan, user_profile)
+            files.append((name, data))
+        except Exception as e:
+            errors.append((name, f"{type(e).__name__}: {e}"))
+    return files, errors, time.perf_counter() - start
+
+
+def _rendered(future, stem, extensions):
+    """(files, errors) of a finished render_files call"""
+    try:
+        files, errors, seconds = future.result()
+    except concurrent.futures.process.BrokenProcessPool:
+        raise
+    except Exception as e:
+        # The call itself failed, e.g. a plan that couldn't be sent to the render process
+        return [], [(f"{stem}.{extension}", f"{type(e).__name__}: {e}") for extension in extensions]
+    metrics.observe("export.bulk", seconds, error=bool(errors))
+    return files, errors
+
+
+def _add_files(archive, files):
+    for name, data in files:
+        extension = name.rpartition(".")[2]
+        compress_type = zipfile.ZIP_STORED if extension in _STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        archive.writestr(name, data, compress_type=compress_type)
+        metrics.count("bulk_export_files", format=extension)
+
+
+def write_archive(records, output, extensions=("pdf",), pool=None, workers=EXPORT_WORKERS, on_progress=None):
+    """Render records into a ZIP archive written to output (a path or binary file object).
+
+    records yields (profile_id, dietary_plan, fitness_plan, user_profile) and
+    is read only as fast as documents are rendered, by pool (with workers
+    processes; the shared render pool by default). on_progress(done,
+    profile_id, errors) is called as each user's documents are written.
+    Users whose ids share a file name get numbered suffixes, e.g. a_b-2.pdf.
+    Returns (files written, [(file name, error)]).
+    """
+    pool = pool or get_render_pool()
+    extensions = tuple(extensions)
+    records = iter(records)
+    pending = {}
+    stems = set()
+    written, errors, done = 0, [], 0
+
+    def submit_next():
+        record = next(records, None)
+        if record is not None:
+            profile_id, *plans = record
+            stem = unique_stem(profile_id, stems)
+            pending[pool.submit(render_files, stem, *plans, extensions)] = profile_id, stem
+        return record is not None
+
+    try:
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            more = True
+            while more and len(pending) < PENDING_PER_WORKER * workers:
+                more = submit_next()
+            while pending:
+                finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    profile_id, stem = pending.pop(future)
+                    files, record_errors = _rendered(future, stem, extensions)
+                    _add_files(archive, files)
+                    written += len(files)
+                    errors.extend(record_errors)
+                    done += 1
+                    if record_errors:
+                        metrics.count("bulk_export_errors", len(record_errors))
+                    if on_progress is not None:
+                        on_progress(done, profile_id, record_errors)
+                    # Each finished user makes room for the next, so only a few documents are ever held
+                    if more:
+                        more = submit_next()
+            if errors:
+                archive.writestr(ERRORS_NAME, json.dumps(dict(errors), ensure_ascii=False, indent=2))
+    except concurrent.futures.process.BrokenProcessPool:
+        _discard_render_pool(pool)
+        raise
+    finally:
+        # Renders not yet started when the archive fails (e.g. its reader went away) are dropped
+        for future in pending:
+            future.cancel()
+    return written, errors
+
+
+class _Pipe(io.RawIOBase):
+    """Unseekable file handing what's written to a reader, a bounded number of chunks ahead.
+
+    Writes fail once the reader has abandoned the pipe, or has taken nothing for idle_timeout seconds.
+    """
+
+    def __init__(self, max_chunks, idle_timeout):
+        self.chunks = queue.Queue(max_chunks)
+        self.abandoned = threading.Event()
+        self.idle_timeout = idle_timeout
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.put(bytes(data))
+        return len(data)
+
+    def put(self, chunk):
+        waited = 0
+        while not self.abandoned.is_set():
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                waited += 1
+                if waited >= self.idle_timeout:
+                    self.abandoned.set()
+        raise BrokenPipeError("The archive's reader went away")
+
+
+class ArchiveStream:
+    """A ZIP archive of records, read as byte chunks while a background thread writes it, e.g. for an HTTP response.
+
+    Writing starts at once and stays at most STREAM_CHUNKS chunks ahead of
+    the reader. It stops early when the reader calls close(), or when a
+    reader takes nothing for STREAM_IDLE_TIMEOUT seconds, e.g. a client that
+    went away. on_finished() is called from the writer thread once it has
+    stopped. Render errors end up in errors.json inside the archive.
+    """
+
+    def __init__(self, records, extensions=("pdf",), pool=None, on_finished=None):
+        self._pipe = _Pipe(STREAM_CHUNKS, STREAM_IDLE_TIMEOUT)
+        self._failure = None
+        self._finished = False
+        self._on_finished = on_finished
+        self._writer = threading.Thread(
+            target=self._write, args=(records, tuple(extensions), pool), name="bulk-export", daemon=True
+        )
+        self._writer.start()
+
+    def _write(self, records, extensions, pool):
+        try:
+            with io.BufferedWriter(self._pipe, buffer_size=STREAM_CHUNK_SIZE) as buffered:
+                write_archive(records, buffered, extensions, pool=pool)
+        except Exception as e:
+            self._failure = e
+        finally:
+            try:
+                self._pipe.put(None)
+            except BrokenPipeError:
+                pass
+            if self._on_finished is not None:
+                self._on_finished()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished or self._pipe.abandoned.is_set():
+            raise StopIteration
+        chunk = self._pipe.chunks.get()
+        if chunk is None:
+            self._finished = True
+            if self._failure is not None:
+                raise self._failure
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        """Stop the writer at its next chunk"""
+        self._pipe.abandoned.set()
+
+
+def index_records(path):
+    """Offsets of the latest successful record per id in a batch_generate output file, and ids that never succeeded"""
+    offsets, failed = {}, set()
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            line_offset, offset = offset, offset + len(line)
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial last line from an interrupted run
+            if record.get("errors"):
+                failed.add(record["id"])
+            else:
+                offsets[record["id"]] = line_offset
+    return list(offsets.values()), failed - offsets.keys()
+
+
+def read_records(path, offsets):
+    """Yield (profile_id, dietary_plan, fitness_plan, user_profile) for the records at offsets, one at a time"""
+    from plan_generation import build_user_profile
+
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            record = json.loads(f.readline())
+            user_profile = build_user_profile(record["profile"], record.get("targets"))
+            yield record["id"], record["dietary_plan"], record["fitness_plan"], user_profile
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export many users' health and fitness plans into one ZIP archive.")
+    parser.add_argument("input", help="JSONL results written by batch_generate.py")
+    parser.add_argument("--output", default="plans.zip", help="ZIP archive to write")
+    parser.add_argument("--formats", nargs="+", choices=list(_FORMATS_BY_EXTENSION), default=["pdf"],
+                        help="files exported per user")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="render processes")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    offsets, failed = index_records(args.input)
+    total = len(offsets)
+
+    def on_progress(done, profile_id, errors):
+        status = "failed: " + "; ".join(f"{name}: {error}" for name, error in errors) if errors else "ok"
+        print(f"[{done}/{total}] {profile_id} {status}", file=sys.stderr)
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        written, errors = write_archive(
+            read_records(args.input, offsets), args.output, args.formats,
+            pool=pool, workers=args.workers, on_progress=on_progress,
+        )
+    print(f"Done: {written} files for {total} users in {args.output}, {len(errors)} failed, "
+          f"{len(failed)} without plans", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""Bundled catalog of Malaysian ingredients and exercises, indexed for constraint filtering.
+
+Each indexed value (an allergen or diet tag, a state, a piece of equipment, a
+setting) maps to a bitset over the catalog entries, kept as a Python int with
+bit i set for entry i. Filtering a profile is a handful of ANDs and ORs, so the
+shortlist sent to the agents and the check of their answers cost microseconds.
+"""
+import functools
+import json
+import os
+import re
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json")
+
+# Entries named in the agents' prompts; the rest of the catalog is still used to check their answers
+SHORTLIST_INGREDIENTS = 30
+SHORTLIST_EXERCISES = 15
+SHORTLIST_AVOID = 15
+
+ALLERGEN_TAGS = {
+    "Nuts": "nuts",
+    "Shellfish": "shellfish",
+    "Dairy": "dairy",
+    "Eggs": "egg",
+    "Wheat": "wheat",
+    "Soy": "soy",
+}
+
+DIET_EXCLUDED_TAGS = {
+    "Vegetarian": ("meat", "fish", "shellfish"),
+    "Vegan": ("meat", "fish", "shellfish", "egg", "dairy", "honey"),
+    "Keto": ("high_carb", "sugar"),
+    "Gluten Free": ("gluten",),
+    "Low Carb": ("high_carb", "sugar"),
+    "Dairy Free": ("dairy",),
+    "Halal": ("pork", "alcohol"),
+    "Kosher": ("pork", "shellfish"),
+}
+
+CONDITION_EXCLUDED_TAGS = {
+    "Diabetes": ("sugar",),
+    "Hypertension": ("high_sodium",),
+    "Heart Disease": ("high_sodium",),
+}
+
+# Medical conditions and lifestyle factors both rule exercises out
+EXERCISE_EXCLUDED_TAGS = {
+    "Arthritis": ("high_impact",),
+    "Osteoporosis": ("high_impact", "heavy_lifting"),
+    "Heart Disease": ("high_intensity", "heavy_lifting"),
+    "Hypertension": ("heavy_lifting",),
+    "Obesity": ("high_impact",),
+    "Limited Mobility": ("high_impact", "high_intensity", "floor"),
+}
+
+# Words before a food that make it a stand-in for it, e.g. "oat milk", "rice noodles" or "vegan cheese"
+SUBSTITUTE_WORDS = {
+    "almond", "oat", "rice", "soy", "soya", "coconut", "cashew", "hemp", "pea", "macadamia", "hazelnut",
+    "vegan", "vegetarian", "plant-based", "eggless", "mock",
+}
+# "Peanut-free", "no egg", "non-dairy": what they name is left out, not included
+_FREE_OF = re.compile(r"\b[\w'-]+-free\b|\b(?:no|non|without)[- ]+[\w'-]+", re.IGNORECASE)
+
+# Bodyweight exercises need no equipment, so "None" is always available
+BODYWEIGHT = "None"
+# Entries with no regions or settings are available everywhere
+EVERYWHERE = "*"
+ANY_MALAYSIAN_STATE = "Other Malaysian State"
+
+
+def _bits(mask):
+    """Indexes of the set bits in mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class CatalogIndex:
+    """Catalog entries with a bitset per value of each indexed field, and a matcher for their names"""
+
+    def __init__(self, entries, fields):
+        self.entries = entries
+        self.all = (1 << len(entries)) - 1
+        self.bits = {field: {} for field in fields}
+        for i, entry in enumerate(entries):
+            for field in fields:
+                for value in entry.get(field) or [EVERYWHERE]:
+                    self.bits[field][value] = self.bits[field].get(value, 0) | 1 << i
+
+        self._term_entries = {}
+        for i, entry in enumerate(entries):
+            for term in entry["aliases"]:
+                self._term_entries[term.lower()] = i
+        # Longest terms first, so "coconut milk" wins over "milk"
+        terms = "(" + "|".join(map(re.escape, sorted(self._term_entries, key=len, reverse=True))) + r")(?:e?s)?"
+        self._terms = re.compile(r"\b" + terms + r"\b", re.IGNORECASE)
+        self._exact = re.compile(terms, re.IGNORECASE)
+
+    def any_of(self, field, values):
+        """Entries with any of the values in field; entries without the field match every value"""
+        index = self.bits[field]
+        mask = index.get(EVERYWHERE, 0)
+        for value in values:
+            mask |= index.get(value, 0)
+        return mask
+
+    def tagged(self, tags):
+        mask = 0
+        for tag in tags:
+            mask |= self.bits["tags"].get(tag, 0)
+        return mask
+
+    def matching(self, text):
+        """Entries named in free text, except ones it says are left out ("peanut-free")"""
+        mask = 0
+        for match in self._terms.finditer(_FREE_OF.sub(" ", text or "")):
+            mask |= 1 << self._term_entries[match.group(1).lower()]
+        return mask
+
+    def named_by(self, name, excluded):
+        """(entry, certain) for the first entry in the excluded mask an item name refers to, or None.
+
+        A name that is exactly an entry's, alone or in parentheses, is that
+        entry, so "Rice noodles (bihun)" is bihun. Otherwise a term after a
+        substitute ("oat milk") doesn't count, and one in a name with a
+        "-free" or "no ..." qualifier only might be meant (certain is False).
+        """
+        parts = [part.strip() for part in re.split(r"[()]", name or "") if part.strip()]
+        exact = [self._term_entries[match.group(1).lower()] for match in map(self._exact.fullmatch, parts) if match]
+        for i in exact:
+            if excluded >> i & 1:
+                return i, True
+        if exact:
+            return None
+        qualified = _FREE_OF.search(name) is not None
+        text = _FREE_OF.sub(" ", name)
+        for match in self._terms.finditer(text):
+            i = self._term_entries[match.group(1).lower()]
+            before = text[:match.start()].split()
+            if excluded >> i & 1 and not (before and before[-1].lower() in SUBSTITUTE_WORDS):
+                return i, not qualified
+        return None
+
+    def names(self, mask, limit=None):
+        names = [self.entries[i]["name"] for i in _bits(mask)]
+        return names[:limit] if limit is not None else names
+
+
+@functools.lru_cache(maxsize=None)
+def get_catalog():
+    """Process-wide (ingredients, exercises) indexes, built from the bundled catalog on first use"""
+    with open(CATALOG_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    return (
+        CatalogIndex(data["ingredients"], ("tags", "regions")),
+        CatalogIndex(data["exercises"], ("tags", "equipment", "settings")),
+    )
+
+
+def _selected(values):
+    return [value for value in values if value and value != "None"]
+
+
+def ingredient_rules(profile):
+    """(reason, excluded ingredient mask) for each of the profile's allergies, diet and conditions"""
+    ingredients, _ = get_catalog()
+    rules = []
+    for allergy in _selected(profile["food_allergies"]):
+        tag = ALLERGEN_TAGS.get(allergy, allergy.strip().lower())
+        # Allergies typed in by the user may name an ingredient rather than a tag
+        mask = ingredients.tagged([tag]) | ingredients.matching(allergy)
+        if mask:
+            rules.append((f"{allergy} allergy", mask))
+    diet = profile["dietary_preferences"]
+    if diet in DIET_EXCLUDED_TAGS:
+        rules.append((f"{diet} diet", ingredients.tagged(DIET_EXCLUDED_TAGS[diet])))
+    for condition in _selected(profile["medical_conditions"]):
+        if condition in CONDITION_EXCLUDED_TAGS:
+            rules.append((condition, ingredients.tagged(CONDITION_EXCLUDED_TAGS[condition])))
+    return rules
+
+
+def _reach_rules(profile):
+    """Rules for exercises the profile's equipment and setting put out of reach"""
+    _, exercises = get_catalog()
+    equipment = _selected(profile["equipment_access"])
+    setting = profile["living_environment"]
+    return [
+        (f"needs equipment beyond {', '.join(equipment) or 'bodyweight'}",
+         exercises.all & ~exercises.any_of("equipment", [BODYWEIGHT] + equipment)),
+        (f"not practical in a {setting} setting", exercises.all & ~exercises.any_of("settings", [setting])),
+    ]
+
+
+def _health_rules(profile):
+    """Rules for exercises the profile's medical conditions and lifestyle advise against"""
+    _, exercises = get_catalog()
+    return [
+        (f"not advised with {factor}", exercises.tagged(EXERCISE_EXCLUDED_TAGS[factor]))
+        for factor in _selected(profile["medical_conditions"]) + list(profile["lifestyle_factors"])
+        if factor in EXERCISE_EXCLUDED_TAGS
+    ]
+
+
+def exercise_rules(profile):
+    """(reason, excluded exercise mask) for the profile's equipment, setting, conditions and lifestyle"""
+    return _reach_rules(profile) + _health_rules(profile)
+
+
+def _excluded(rules):
+    mask = 0
+    for _, excluded in rules:
+        mask |= excluded
+    return mask
+
+
+def _reason(rules, i):
+    return next(reason for reason, excluded in rules if excluded >> i & 1)
+
+
+def region_mask(index, region):
+    """Ingredients found everywhere plus the region's own; the whole catalog for an unnamed Malaysian state"""
+    if region == ANY_MALAYSIAN_STATE:
+        return index.all
+    return index.any_of("regions", [region])
+
+
+def shortlist(profile):
+    """Catalog names for the agents' prompts: suitable ingredients and exercises, and ones to avoid"""
+    ingredients, exercises = get_catalog()
+    food_rules = ingredient_rules(profile)
+    available = region_mask(ingredients, profile["region"])
+    excluded_food = _excluded(food_rules)
+    # State specialities first, then ingredients found everywhere
+    regional = available & ~ingredients.bits["regions"].get(EVERYWHERE, 0)
+    suitable_food = ingredients.names(regional & ~excluded_food) + ingredients.names(available & ~regional & ~excluded_food)
+
+    within_reach = exercises.all & ~_excluded(_reach_rules(profile))
+    advised_against = _excluded(_health_rules(profile))
+    return {
+        "ingredients": suitable_food[:SHORTLIST_INGREDIENTS],
+        "avoid_ingredients": ingredients.names(available & excluded_food, SHORTLIST_AVOID),
+        "exercises": exercises.names(within_reach & ~advised_against, SHORTLIST_EXERCISES),
+        "avoid_exercises": exercises.names(within_reach & advised_against, SHORTLIST_AVOID),
+    }
+
+
+def shortlist_prompts(profile):
+    """Per-agent prompt lines naming the shortlist, in the same "Label: value" form as the profile"""
+    names = shortlist(profile)
+
+    def lines(*pairs):
+        return "\n".join(f"{label}: {', '.join(names[key])}" for label, key in pairs if names[key])
+
+    return {
+        "dietary": lines(("Suggested Local Ingredients", "ingredients"), ("Ingredients To Avoid", "avoid_ingredients")),
+        "fitness": lines(("Suggested Exercises", "exercises"), ("Exercises To Avoid", "avoid_exercises")),
+    }
+
+
+def _violation(index, rules, name):
+    """(catalog name, reason, certain) for the ruled-out entry an item name refers to, or None"""
+    named = index.named_by(name, _excluded(rules))
+    if named is None:
+        return None
+    i, certain = named
+    return index.entries[i]["name"], _reason(rules, i), certain
+
+
+def check_dietary_plan(plan, profile):
+    """Drop meal items the profile rules out, noting each removal under important_considerations.
+
+    Items that only might be ruled out, and plans kept as markdown (which
+    can't be edited safely), get a warning instead.
+    """
+    ingredients, _ = get_catalog()
+    rules = ingredient_rules(profile)
+    if not rules:
+        return plan, 0
+    notes = []
+    if plan.get("meals"):
+        meals = []
+        for meal in plan["meals"]:
+            items = []
+            for item in meal.get("items", []):
+                violation = _violation(ingredients, rules, item.get("name", ""))
+                if violation is None or not violation[2]:
+                    items.append(item)
+                if violation is None:
+                    continue
+                meal_name = meal.get("name") or "a meal"
+                if violation[2]:
+                    notes.append(f"Removed {item['name']} from {meal_name} ({violation[1]}).")
+                else:
+                    notes.append(f"Check {item['name']} in {meal_name} before eating ({violation[1]}): "
+                                 f"it may contain {violation[0]}.")
+            meals.append({**meal, "items": items})
+        plan = {**plan, "meals": meals}
+    else:
+        mask = ingredients.matching(plan.get("meal_plan", "")) & _excluded(rules)
+        notes = [f"Check before eating ({_reason(rules, i)}): this plan mentions {ingredients.entries[i]['name']}."
+                 for i in _bits(mask)]
+    if notes:
+        plan = {**plan, "important_considerations": notes + list(plan.get("important_considerations", []))}
+    return plan, len(notes)
+
+
+def check_fitness_plan(plan, profile):
+    """Drop exercises the profile rules out, noting each removal under tips; ones that only might be get a warning"""
+    _, exercises = get_catalog()
+    rules = exercise_rules(profile)
+    notes = []
+    if plan.get("sessions"):
+        sessions = []
+        for session in plan["sessions"]:
+            kept = []
+            for exercise in session.get("exercises", []):
+                violation = _violation(exercises, rules, exercise.get("name", ""))
+                if violation is None or not violation[2]:
+                    kept.append(exercise)
+                if violation is None:
+                    continue
+                session_name = session.get("name") or "a session"
+                if violation[2]:
+                    notes.append(f"Removed {exercise['name']} from {session_name} ({violation[1]}).")
+                else:
+                    notes.append(f"Check {exercise['name']} in {session_name} before starting ({violation[1]}): "
+                                 f"it may be {violation[0]}.")
+            sessions.append({**session, "exercises": kept})
+        plan = {**plan, "sessions": sessions}
+    else:
+        mask = exercises.matching(plan.get("routine", "")) & _excluded(rules)
+        notes = [f"Check before starting ({_reason(rules, i)}): this routine includes {exercises.entries[i]['name']}."
+                 for i in _bits(mask)]
+    if notes:
+        plan = {**plan, "tips": notes + list(plan.get("tips", []))}
+    return plan, len(notes)
@@ -0,0 +1,156 @@
+"""Gemini context caching for long, static prompt prefixes.
+
+A prefix is uploaded once per API key, model and text. Requests then name the
+cached content instead of resending the prefix, so it's billed at the cached
+token rate and the first token arrives sooner. Gemini only caches prefixes
+above a model-dependent size. Shorter prefixes, other models and failed
+uploads fall back to sending the prefix inline, and a failed upload isn't
+retried for a while.
+"""
+import collections
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import metrics
+from llm_calls import api_key_fingerprint
+from qa_session import estimate_tokens
+
+logger = logging.getLogger("health_agent.context_cache")
+
+ENABLED = os.environ.get("GEMINI_CONTEXT_CACHE", "1") != "0"
+DEFAULT_TTL = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", 3600))
+
+# Shortest prefix Gemini will cache, by model id prefix (longest match wins)
+MIN_TOKENS = {
+    "gemini-1.5": 32768,
+    "gemini-2.0": 4096,
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+}
+DEFAULT_MIN_TOKENS = 4096
+
+# Recreate a cache this long before it expires, so requests never name an expired one
+REFRESH_MARGIN = 60
+# Seconds before a prefix that failed to upload is tried again
+RETRY_AFTER = 600
+MAX_ENTRIES = 1024
+
+
+def min_tokens(model_id):
+    override = os.environ.get("GEMINI_CONTEXT_CACHE_MIN_TOKENS")
+    if override:
+        return int(override)
+    matches = [prefix for prefix in MIN_TOKENS if (model_id or "").startswith(prefix)]
+    return MIN_TOKENS[max(matches, key=len)] if matches else DEFAULT_MIN_TOKENS
+
+
+class ContextCache:
+    """Copies of a model bound to cached prefixes, keyed by API key, model and prefix text"""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        # key -> (model bound to the cache, or None to send the prefix inline; valid until)
+        self._entries = collections.OrderedDict()
+        self._creating = {}
+        # Model ids already reported as having prefixes too short to cache
+        self._too_short = set()
+        self._lock = threading.Lock()
+
+    def model_for(self, model, system_instruction, ttl=None):
+        """Copy of model that reads system_instruction from a context cache, or None to send it inline"""
+        if not hasattr(model, "get_client"):
+            return None
+        tokens, minimum = estimate_tokens(system_instruction), min_tokens(model.id)
+        if tokens < minimum:
+            self._report_too_short(model.id, tokens, minimum)
+            return None
+        ttl = ttl or self.ttl
+        key = (
+            api_key_fingerprint(model.api_key or ""),
+            model.id,
+            hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+        )
+        with self._lock:
+            entry = self._fresh(key)
+            if entry is None:
+                creating = self._creating.setdefault(key, threading.Lock())
+        if entry is not None:
+            metrics.count("context_cache", result="hit" if entry[0] is not None else "fallback")
+            return entry[0]
+
+        # One upload per prefix; concurrent requests for it wait and reuse the result
+        with creating:
+            with self._lock:
+                entry = self._fresh(key)
+            if entry is None:
+                entry = self._create(model, system_instruction, ttl)
+                with self._lock:
+                    self._entries[key] = entry
+                    self._creating.pop(key, None)
+                    while len(self._entries) > MAX_ENTRIES:
+                        self._entries.popitem(last=False)
+        return entry[0]
+
+    def _report_too_short(self, model_id, tokens, minimum):
+        """Log once per model that its prefixes are sent inline, so an inactive cache isn't mistaken for a working one"""
+        metrics.count("context_cache", result="too_short")
+        with self._lock:
+            if model_id in self._too_short:
+                return
+            self._too_short.add(model_id)
+        logger.info(
+            "Context caching is inactive for %s: a %d-token prompt prefix is below its %d-token minimum, "
+            "so prefixes are sent inline",
+            model_id, tokens, minimum,
+        )
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _create(self, model, system_instruction, ttl):
+        try:
+            from google.genai import types
+
+            cache = model.get_client().caches.create(
+                model=model.id,
+                config=types.CreateCachedContentConfig(system_instruction=system_instruction, ttl=f"{ttl}s"),
+            )
+        except Exception as e:
+            logger.warning("Context cache unavailable for %s, sending the prompt prefix inline: %s", model.id, e)
+            metrics.count("context_cache", result="error")
+            return None, time.time() + RETRY_AFTER
+        metrics.count("context_cache", result="created")
+        cached = copy.copy(model)
+        cached.cached_content = cache.name
+        return cached, time.time() + ttl - REFRESH_MARGIN
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    """Process-wide context cache, or None when GEMINI_CONTEXT_CACHE=0"""
+    global _context_cache
+    if not ENABLED:
+        return None
+    with _context_cache_lock:
+        if _context_cache is None:
+            _context_cache = ContextCache()
+        return _context_cache
+
+
+def cached_model(model, system_instruction, ttl=None):
+    """model bound to a context cache holding system_instruction, or None to send it inline"""
+    context_cache = get_context_cache()
+    if context_cache is None:
+        return None
+    return context_cache.model_for(model, system_instruction, ttl=ttl)
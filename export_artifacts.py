@@ -0,0 +1,85 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+
+import metrics
+from plan_cache import MemoryPlanCache
+
+# Export format -> (plan_export function, mime type, file extension)
+EXPORT_FORMATS = {
+    "PDF": ("create_plan_pdf", "application/pdf", "pdf"),
+    "Text": ("create_plan_text", "text/plain", "txt"),
+    "Markdown": ("create_plan_markdown", "text/markdown", "md"),
+    "JSON": ("create_plan_json", "application/json", "json"),
+}
+
+
+def render_export(export_format, *plans):
+    """Bytes of one export format for (dietary_plan, fitness_plan, user_profile)"""
+    # plan_export pulls in ReportLab, so it's only imported once an export is rendered
+    import plan_export
+
+    with metrics.timed(f"export.{export_format.lower()}"):
+        rendered = getattr(plan_export, EXPORT_FORMATS[export_format][0])(*plans)
+    return rendered.getvalue() if hasattr(rendered, "getvalue") else rendered.encode("utf-8")
+
+
+# Small, shared pool: exports are CPU-bound and only need to beat the user to the button
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="plan-export")
+
+
+def plan_version(dietary_plan, fitness_plan, user_profile):
+    """Hash identifying one generated version of a user's plans"""
+    payload = json.dumps([dietary_plan, fitness_plan, user_profile], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExportArtifacts:
+    """Export files for one plan version, rendered once in the background (again if a render failed)"""
+
+    def __init__(self, dietary_plan, fitness_plan, user_profile, formats=tuple(EXPORT_FORMATS)):
+        self.version = plan_version(dietary_plan, fitness_plan, user_profile)
+        self._plans = (dietary_plan, fitness_plan, user_profile)
+        self._lock = threading.Lock()
+        # Cheap formats are queued first so they're ready while the PDF is still rendering
+        self._futures = {name: self._submit(name) for name in sorted(formats, key=lambda name: name == "PDF")}
+
+    def _submit(self, export_format):
+        return _executor.submit(render_export, export_format, *self._plans)
+
+    def _future(self, export_format):
+        """The format's render; one that failed is started again rather than failing every later request"""
+        with self._lock:
+            future = self._futures[export_format]
+            if future.done() and future.exception() is not None:
+                future = self._futures[export_format] = self._submit(export_format)
+            return future
+
+    def ready(self, export_format):
+        return self._futures[export_format].done()
+
+    def get(self, export_format, timeout=None):
+        """(bytes, mime type, file extension) for a format, waiting if it's still rendering"""
+        _, mime_type, extension = EXPORT_FORMATS[export_format]
+        return self._future(export_format).result(timeout=timeout), mime_type, extension
+
+
+# Rendered exports are kept per plan version for every session to share, bounded so memory stays flat
+_artifacts = MemoryPlanCache(
+    max_entries=int(os.environ.get("EXPORT_CACHE_ENTRIES", 32)),
+    ttl=float(os.environ.get("EXPORT_CACHE_TTL", 60 * 60)),
+)
+_artifacts_lock = threading.Lock()
+
+
+def get_export_artifacts(dietary_plan, fitness_plan, user_profile):
+    """Artifacts for this plan version, reused if still cached, else rendering in the background"""
+    version = plan_version(dietary_plan, fitness_plan, user_profile)
+    with _artifacts_lock:
+        artifacts = _artifacts.get(version)
+        if artifacts is None:
+            artifacts = ExportArtifacts(dietary_plan, fitness_plan, user_profile)
+            _artifacts.set(version, artifacts)
+    return artifacts
@@ -1,25 +1,26 @@
+import os
+import uuid
 import streamlit as st
-import asyncio
-import nest_asyncio
-from agno.agent import Agent
-from agno.models.google import Gemini
-import io
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-
-# Apply nest_asyncio to allow nested event loops
-nest_asyncio.apply()
-
-st.set_page_config(
-    page_title="AI Health & Fitness Planner",
-    page_icon="🏋️‍♂️",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-st.markdown("""
+import metrics
+from export_artifacts import EXPORT_FORMATS, get_export_artifacts, plan_version
+from llm_calls import call_agent
+from multi_day import PLAN_LENGTHS, assemble_progress, days_done, plan_length
+from plan_format import meal_plan_markdown, routine_markdown
+from plan_generation import clean_selection, make_dietary_plan, make_fitness_plan, qa_request
+from plan_jobs import DONE, get_job_queue, submit_plan_job
+from qa_session import get_qa_session
+from resources import get_event_loop, get_gemini_model
+from session_store import QAHistory, get_session_store
+
+# Seconds a Q&A answer may take, including retries
+QA_TIMEOUT = 60
+
+# Seconds between progress checks while a plan is generating in the background
+JOB_POLL_INTERVAL = 0.5
+
+# Static page style. Streamlit drops elements a rerun doesn't emit, so it is re-sent each
+# rerun, but as a compiled constant nothing is rebuilt
+PAGE_STYLE = """
     <style>
     .main {
         padding: 2rem;
@@ -46,7 +47,16 @@ st.markdown("""
         font-weight: 600;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+st.set_page_config(
+    page_title="AI Health & Fitness Planner",
+    page_icon="🏋️‍♂️",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+st.markdown(PAGE_STYLE, unsafe_allow_html=True)
 
 def display_dietary_plan(plan_content):
     with st.expander("📋 Your Personalized Dietary Plan", expanded=True):
@@ -56,14 +66,12 @@ def display_dietary_plan(plan_content):
             st.markdown("### 🎯 Why this plan works")
             st.info(plan_content.get("why_this_plan_works", "Information not available"))
             st.markdown("### 🍽️ Meal Plan")
-            st.write(plan_content.get("meal_plan", "Plan not available"))
+            st.markdown(meal_plan_markdown(plan_content) or "Plan not available")
         
         with col2:
             st.markdown("### ⚠️ Important Considerations")
-            considerations = plan_content.get("important_considerations", "").split('\n')
-            for consideration in considerations:
-                if consideration.strip():
-                    st.warning(consideration)
+            for consideration in plan_content.get("important_considerations", []):
+                st.warning(consideration)
 
 def display_fitness_plan(plan_content):
     with st.expander("💪 Your Personalized Fitness Plan", expanded=True):
@@ -71,28 +79,103 @@ def display_fitness_plan(plan_content):
         
         with col1:
             st.markdown("### 🎯 Goals")
-            st.success(plan_content.get("goals", "Goals not specified"))
+            st.success(plan_content.get("goals") or "Goals not specified")
             st.markdown("### 🏋️‍♂️ Exercise Routine")
-            st.write(plan_content.get("routine", "Routine not available"))
+            st.markdown(routine_markdown(plan_content) or "Routine not available")
         
         with col2:
             st.markdown("### 💡 Pro Tips")
-            tips = plan_content.get("tips", "").split('\n')
-            for tip in tips:
-                if tip.strip():
-                    st.info(tip)
+            for tip in plan_content.get("tips", []):
+                st.info(tip)
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def display_plan_job():
+    """Show a background generation's progress; once it finishes, keep its plans and rerun the page"""
+    job_id = st.session_state.get("plan_job")
+    job = get_job_queue().get(job_id) if job_id else None
+    if job is not None and not job.finished:
+        profile = st.session_state.get("plan_job_profile")
+        with st.spinner("Creating your perfect health and fitness routine..."):
+            if profile and plan_length(profile) > 1:
+                # Programs fill in day by day, in order, as each day's sub-request streams in
+                total = plan_length(profile)
+                done = days_done(job.progress)
+                st.progress(done / total, text=f"{done} of {total} days ready")
+                dietary_plan, fitness_plan = assemble_progress(job.progress, profile)
+                display_dietary_plan(dietary_plan)
+                display_fitness_plan(fitness_plan)
+            else:
+                # Partial JSON is rendered field by field as it streams in
+                display_dietary_plan(make_dietary_plan(job.progress.get("dietary", ""), partial=True))
+                display_fitness_plan(make_fitness_plan(job.progress.get("fitness", ""), profile, partial=True))
+        return
+
+    st.session_state.pop("plan_job", None)
+    st.session_state.pop("plan_job_profile", None)
+    st.query_params.pop("job", None)
+    if job is None:
+        st.session_state.plan_job_error = "Your plan request has expired, please generate it again"
+    elif job.status != DONE:
+        st.session_state.plan_job_error = job.error
+    else:
+        plans = job.result
+        st.session_state.plan_job_error = None
+        # Plans live compressed in the session store; session state only keeps their version
+        get_session_store().put(st.session_state.session_id, "plans", plans)
+        st.session_state.plan_version = plan_version(
+            plans["dietary_plan"], plans["fitness_plan"], plans["user_profile"]
+        )
+        st.session_state.plans_generated = True
+        st.session_state.qa_history.clear()
+        # Render every export format in the background, into the process-wide cache keyed by plan version
+        get_export_artifacts(plans["dietary_plan"], plans["fitness_plan"], plans["user_profile"])
+    st.rerun()
+
+def load_plans():
+    """This session's plans from the session store, or None if there are none or they have expired"""
+    if not st.session_state.plans_generated:
+        return None
+    plans = get_session_store().get(st.session_state.session_id, "plans")
+    if plans is None:
+        st.session_state.plans_generated = False
+        st.warning("Your plans have expired, please generate them again")
+    return plans
+
+def display_qa_history(history):
+    """One page of Q&A history at a time, newest page first"""
+    page = history.pages - 1
+    if history.pages - history.first_page > 1:
+        page = st.number_input(
+            "Page", min_value=history.first_page + 1, max_value=history.pages, value=history.pages
+        ) - 1
+    for i, (question, answer) in enumerate(history.page(page), start=page * history.page_size):
+        st.markdown(f"**Q{i+1}:** {question}")
+        st.markdown(f"**A{i+1}:** {answer}")
+        st.divider()
+
+def display_metrics_panel():
+    with st.expander("📈 Metrics"):
+        snapshot = metrics.snapshot()
+        st.dataframe(
+            [{"stage": stage, **stats} for stage, stats in sorted(snapshot["stages"].items())],
+            hide_index=True,
+        )
+        for counter in snapshot["counters"]:
+            labels = ", ".join(f"{key}={value}" for key, value in counter["labels"].items())
+            st.caption(f"{counter['name']} ({labels}): {counter['value']:g}")
 
 def main():
-    # Set up a new event loop for this thread
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    metrics.start_exporters()
     
-    if 'dietary_plan' not in st.session_state:
-        st.session_state.dietary_plan = {}
-        st.session_state.fitness_plan = {}
-        st.session_state.qa_pairs = []
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+        st.session_state.qa_history = QAHistory(st.session_state.session_id)
         st.session_state.plans_generated = False
 
+    # A reconnected browser gets a new session; the job id in the URL lets it pick its plan back up
+    if "plan_job" not in st.session_state and "job" in st.query_params:
+        st.session_state.plan_job = st.query_params["job"]
+
     st.title("🏋️‍♂️ AI Health & Fitness Planner")
     st.markdown("""
         <div style='background-color: #0000; padding: 1rem; border-radius: 0.5rem; margin-bottom: 2rem;'>
@@ -116,6 +199,12 @@ def main():
         
         st.success("API Key accepted!")
 
+        if os.environ.get("METRICS_ADMIN_PANEL"):
+            display_metrics_panel()
+
+    # Reuse the process-wide event loop for this script thread; only needed once agents are in use
+    get_event_loop()
+
     # Language selector
     st.header("🌐 Language Settings")
     languages = ["English", "Bahasa Malaysia", "Mandarin", "Tamil", "Japanese", "Korean"]
@@ -128,7 +217,8 @@ def main():
 
     if gemini_api_key:
         try:
-            gemini_model = Gemini(id="gemini-1.5-flash", api_key=gemini_api_key)
+            # The model client is built once per API key, then reused
+            model = get_gemini_model(gemini_api_key)
         except Exception as e:
             st.error(f"❌ Error initializing Gemini model: {e}")
             return
@@ -159,6 +249,12 @@ def main():
                     options=["Lose Weight", "Gain Muscle", "Endurance", "Stay Fit", "Strength Training", "Manage Medical Conditions"],
                     help="What do you want to achieve?"
                 )
+                plan_days = st.selectbox(
+                    "Plan Length",
+                    options=list(PLAN_LENGTHS),
+                    format_func=PLAN_LENGTHS.get,
+                    help="Longer programs are generated day by day"
+                )
         
         # Tab 2: Health Details
         with tabs[1]:
@@ -229,130 +325,53 @@ def main():
                 )
 
         if st.button("🎯 Generate My Personalized Plan", use_container_width=True):
-            with st.spinner("Creating your perfect health and fitness routine..."):
-                try:
-                    # Prepare medical conditions string, handling "None" and "Other" properly
-                    final_medical_conditions = []
-                    for condition in medical_conditions:
-                        if condition == "None" and len(medical_conditions) > 1:
-                            continue  # Skip "None" if other conditions are selected
-                        elif condition == "Other" and 'other_conditions' in locals():
-                            final_medical_conditions.append(other_conditions)
-                        else:
-                            final_medical_conditions.append(condition)
-                    
-                    # Prepare allergies string, handling "None" and "Other" properly
-                    final_food_allergies = []
-                    for allergy in food_allergies:
-                        if allergy == "None" and len(food_allergies) > 1:
-                            continue  # Skip "None" if other allergies are selected
-                        elif allergy == "Other" and 'other_allergies' in locals():
-                            final_food_allergies.append(other_allergies)
-                        else:
-                            final_food_allergies.append(allergy)
-                    
-                    # Process region information
-                    final_region = region
-                    if region == "Other Malaysian State" and 'other_state' in locals():
-                        final_region = other_state
-                    elif region == "Other Country" and 'other_country' in locals():
-                        final_region = other_country
-
-                    # Include language in agent instructions
-                    dietary_agent = Agent(
-                        name="Dietary Expert",
-                        role="Provides personalized dietary recommendations",
-                        model=gemini_model,
-                        instructions=[
-                            f"Provide all responses in {st.session_state.language}.",
-                            "Consider the user's input, including dietary restrictions, medical conditions, and cultural background.",
-                            "For diabetic users, focus on low glycemic index foods and proper meal timing.",
-                            "Include locally available ingredients based on the user's region and living environment.",
-                            "For users in rural/kampung areas, suggest recipes using locally grown produce and traditional cooking methods.",
-                            "Respect cultural and religious dietary practices relevant to the user's background.",
-                            "Suggest a detailed meal plan for the day, including breakfast, lunch, dinner, and snacks.",
-                            "Provide specific portion guidance for users with medical conditions like diabetes.",
-                            "Provide a brief explanation of why the plan is suited to the user's goals and medical needs.",
-                        ]
-                    )
-
-                    fitness_agent = Agent(
-                        name="Fitness Expert",
-                        role="Provides personalized fitness recommendations",
-                        model=gemini_model,
-                        instructions=[
-                            f"Provide all responses in {st.session_state.language}.",
-                            "Provide exercises tailored to the user's goals, age, medical conditions, and living environment.",
-                            "For older users, focus on low-impact exercises that improve balance and strength.",
-                            "For users with diabetes, suggest appropriate exercise intensity and timing around meals.",
-                            "Consider available resources in rural/kampung settings - suggest exercises that don't require gym equipment.",
-                            "Include culturally relevant physical activities when appropriate.",
-                            "Design exercises around the equipment the user has access to.",
-                            "Include warm-up, main workout, and cool-down exercises suitable for the user's profile.",
-                            "Explain the benefits of each recommended exercise for their specific conditions.",
-                        ]
-                    )
-
-
-                    user_profile = f"""
-                    Age: {age}
-                    Weight: {weight}kg
-                    Height: {height}cm
-                    Sex: {sex}
-                    Ethnicity: {ethnicity}
-                    Activity Level: {activity_level}
-                    Dietary Preferences: {dietary_preferences}
-                    Food Allergies: {', '.join(final_food_allergies)}
-                    Fitness Goals: {fitness_goals}
-                    Medical Conditions: {', '.join(final_medical_conditions)}
-                    Region: {final_region}
-                    Living Environment: {living_environment}
-                    Equipment Access: {', '.join(equipment_access)}
-                    Lifestyle Factors: {', '.join(lifestyle_factors)}
-                    Preferred Language: {st.session_state.language}
-                    """
-
-                    dietary_plan_response = dietary_agent.run(user_profile)
-                    dietary_plan = {
-                        "why_this_plan_works": "Personalized nutrition based on your profile, medical needs, and cultural background",
-                        "meal_plan": dietary_plan_response.content,
-                        "important_considerations": """
-                        - Hydration: Drink plenty of water throughout the day
-                        - Electrolytes: Monitor sodium, potassium, and magnesium levels
-                        - Fiber: Ensure adequate intake through vegetables and fruits
-                        - Listen to your body: Adjust portion sizes as needed
-                        - For medical conditions: Always consult with your healthcare provider
-                        """
-                    }
-
-                    fitness_plan_response = fitness_agent.run(user_profile)
-                    fitness_plan = {
-                        "goals": f"Personalized exercise plan for {age} year old {ethnicity} {sex.lower()} with {', '.join(final_medical_conditions)} living in {living_environment}",
-                        "routine": fitness_plan_response.content,
-                        "tips": """
-                        - Track your progress regularly
-                        - Allow proper rest between workouts
-                        - Focus on proper form
-                        - Stay consistent with your routine
-                        - Adapt exercises based on how you feel each day
-                        """
-                    }
-                    
-                    # Store the profile in session state
-                    st.session_state.user_profile = user_profile
-
-                    st.session_state.dietary_plan = dietary_plan
-                    st.session_state.fitness_plan = fitness_plan
-                    st.session_state.plans_generated = True
-                    st.session_state.qa_pairs = []
-
-                    display_dietary_plan(dietary_plan)
-                    display_fitness_plan(fitness_plan)
-
-                except Exception as e:
-                    st.error(f"❌ An error occurred: {e}")
-
-        if st.session_state.plans_generated:
+            try:
+                # Process region information
+                final_region = region
+                if region == "Other Malaysian State" and 'other_state' in locals():
+                    final_region = other_state
+                elif region == "Other Country" and 'other_country' in locals():
+                    final_region = other_country
+
+                profile = {
+                    "age": age,
+                    "weight": weight,
+                    "height": height,
+                    "sex": sex,
+                    "ethnicity": ethnicity,
+                    "activity_level": activity_level,
+                    "dietary_preferences": dietary_preferences,
+                    # Handle "None" and "Other" properly
+                    "food_allergies": clean_selection(food_allergies, locals().get('other_allergies')),
+                    "fitness_goals": fitness_goals,
+                    "medical_conditions": clean_selection(medical_conditions, locals().get('other_conditions')),
+                    "region": final_region,
+                    "living_environment": living_environment,
+                    "equipment_access": equipment_access,
+                    "lifestyle_factors": lifestyle_factors,
+                    "language": st.session_state.language,
+                    "plan_days": plan_days,
+                }
+
+                # Generation runs in the background, so reruns and reconnects don't lose it
+                st.session_state.plan_job = submit_plan_job(gemini_api_key, profile)
+                st.session_state.plan_job_profile = profile
+                st.query_params["job"] = st.session_state.plan_job
+            except Exception as e:
+                st.error(f"❌ An error occurred: {e}")
+
+        if "plan_job" in st.session_state:
+            display_plan_job()
+        elif st.session_state.get("plan_job_error"):
+            st.error(f"❌ An error occurred: {st.session_state.pop('plan_job_error')}")
+        plans = load_plans()
+        if plans is not None and "plan_job" not in st.session_state:
+            display_dietary_plan(plans["dietary_plan"])
+            display_fitness_plan(plans["fitness_plan"])
+            for name, error in plans["errors"].items():
+                st.error(f"❌ Could not generate your {name} plan: {error}")
+
+        if plans is not None:
             st.header("❓ Questions about your plan?")
             
             # Enhanced Q&A section with categories
@@ -364,202 +383,59 @@ def main():
             if st.button("Get Answer"):
                 if question_input:
                     with st.spinner("Finding the best answer for you..."):
-                        dietary_plan = st.session_state.dietary_plan
-                        fitness_plan = st.session_state.fitness_plan
+                        qa_session = get_qa_session(
+                            st.session_state.plan_version, plans["dietary_plan"], plans["fitness_plan"]
+                        )
 
-                        context = f"Dietary Plan: {dietary_plan.get('meal_plan', '')}\n\nFitness Plan: {fitness_plan.get('routine', '')}"
-                        full_context = f"{context}\nQuestion Category: {selected_category}\nUser Question: {question_input}"
+                        # Only the plan parts relevant to the category plus a bounded history window
+                        context, request = qa_session.prompt_parts(
+                            question_input, selected_category, st.session_state.qa_history.recent
+                        )
+                        # Agents keep per-run state, so each question gets its own on the shared model
+                        agent, prompt = qa_request(model, context, request)
 
                         try:
-                            agent = Agent(model=gemini_model, show_tool_calls=True, markdown=True)
-                            run_response = agent.run(full_context)
+                            run_response = call_agent(agent, prompt, stage="qa", timeout=QA_TIMEOUT)
 
                             if hasattr(run_response, 'content'):
                                 answer = run_response.content
                             else:
                                 answer = "Sorry, I couldn't generate a response at this time."
 
-                            st.session_state.qa_pairs.append((question_input, answer))
+                            st.session_state.qa_history.append(question_input, answer)
                         except Exception as e:
                             st.error(f"❌ An error occurred while getting the answer: {e}")
 
-            if st.session_state.qa_pairs:
-                with st.expander("💬 Q&A History", expanded=True):
-                    for i, (question, answer) in enumerate(st.session_state.qa_pairs):
-                        st.markdown(f"**Q{i+1}:** {question}")
-                        st.markdown(f"**A{i+1}:** {answer}")
-                        st.divider()
+            if st.session_state.qa_history:
+                with metrics.timed("render.qa_history"), st.expander("💬 Q&A History", expanded=True):
+                    display_qa_history(st.session_state.qa_history)
             
     # Plan export option
     st.header("📤 Export Your Plans")
-    export_format = st.radio("Export format", ["PDF", "Text"])
+    export_format = st.radio("Export format", list(EXPORT_FORMATS))
     # In the export section
     if st.button("Export Plans"):
         try:
-            if "user_profile" not in st.session_state:
+            plans = load_plans()
+            if plans is None:
                 st.error("Please generate your plan first before exporting")
                 return
                 
-            # Use the stored profile
-            user_profile = st.session_state.user_profile
-            
-            # Generate appropriate format
-            if export_format == "PDF":
-                buffer = create_plan_pdf(st.session_state.dietary_plan, st.session_state.fitness_plan, user_profile)
-                mime_type = "application/pdf"
-                file_extension = "pdf"
-            else:  # Text format
-                content = create_plan_text(st.session_state.dietary_plan, st.session_state.fitness_plan, user_profile)
-                buffer = io.BytesIO(content.encode())
-                mime_type = "text/plain"
-                file_extension = "txt"
+            # Artifacts are normally already rendered in the background after generation
+            artifacts = get_export_artifacts(plans["dietary_plan"], plans["fitness_plan"], plans["user_profile"])
+            with st.spinner("Preparing your download..."):
+                data, mime_type, file_extension = artifacts.get(export_format)
             
             st.success("Your personalized health and fitness plans are ready for download!")
             st.download_button(
                 "Download Your Plans",
-                data=buffer,
+                data=data,
                 file_name=f"health_fitness_plan.{file_extension}",
                 mime=mime_type
             )
         except Exception as e:
             st.error(f"❌ Error creating download file: {e}")
 
-
-def create_plan_text(dietary_plan, fitness_plan, user_profile):
-    """Format plans as plain text"""
-    text_content = "=== YOUR PERSONALIZED HEALTH & FITNESS PLAN ===\n\n"
-    
-    # Add user profile summary
-    text_content += "=== USER PROFILE ===\n"
-    for line in user_profile.strip().split("\n"):
-        if line.strip():
-            text_content += f"{line.strip()}\n"
-    
-    # Add dietary plan
-    text_content += "\n\n=== DIETARY PLAN ===\n"
-    text_content += f"\nWHY THIS PLAN WORKS:\n{dietary_plan.get('why_this_plan_works', '')}\n"
-    text_content += f"\nMEAL PLAN:\n{dietary_plan.get('meal_plan', '')}\n"
-    text_content += "\nIMPORTANT CONSIDERATIONS:\n"
-    for consideration in dietary_plan.get('important_considerations', '').split('\n'):
-        if consideration.strip():
-            text_content += f"- {consideration.strip()}\n"
-    
-    # Add fitness plan
-    text_content += "\n\n=== FITNESS PLAN ===\n"
-    text_content += f"\nGOALS:\n{fitness_plan.get('goals', '')}\n"
-    text_content += f"\nEXERCISE ROUTINE:\n{fitness_plan.get('routine', '')}\n"
-    text_content += "\nPRO TIPS:\n"
-    for tip in fitness_plan.get('tips', '').split('\n'):
-        if tip.strip():
-            text_content += f"- {tip.strip()}\n"
-    
-    return text_content
-
-def create_plan_pdf(dietary_plan, fitness_plan, user_profile):
-    """Create a PDF document with formatted plans"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    
-    # Create custom styles
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Title'],
-        fontSize=16,
-        textColor=colors.darkblue,
-        spaceAfter=12
-    )
-    
-    heading_style = ParagraphStyle(
-        'Heading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.darkblue,
-        spaceAfter=6
-    )
-    
-    subheading_style = ParagraphStyle(
-        'SubHeading',
-        parent=styles['Heading3'],
-        fontSize=12,
-        textColor=colors.darkslateblue,
-        spaceAfter=6
-    )
-    
-    # Build the document content
-    elements = []
-    
-    # Title
-    elements.append(Paragraph("Your Personalized Health & Fitness Plan", title_style))
-    elements.append(Spacer(1, 12))
-    
-    # User Profile
-    elements.append(Paragraph("User Profile", heading_style))
-    
-    # Format profile as table
-    profile_data = []
-    for line in user_profile.strip().split("\n"):
-        if line.strip():
-            key_value = line.strip().split(":", 1)
-            if len(key_value) == 2:
-                profile_data.append([key_value[0].strip(), key_value[1].strip()])
-    
-    if profile_data:
-        profile_table = Table(profile_data, colWidths=[150, 350])
-        profile_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.darkblue),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.lightgrey),
-        ]))
-        elements.append(profile_table)
-    
-    elements.append(Spacer(1, 20))
-    
-    # Dietary Plan
-    elements.append(Paragraph("Dietary Plan", heading_style))
-    elements.append(Spacer(1, 6))
-    
-    elements.append(Paragraph("Why This Plan Works", subheading_style))
-    elements.append(Paragraph(dietary_plan.get('why_this_plan_works', ''), styles['Normal']))
-    elements.append(Spacer(1, 10))
-    
-    elements.append(Paragraph("Meal Plan", subheading_style))
-    elements.append(Paragraph(dietary_plan.get('meal_plan', ''), styles['Normal']))
-    elements.append(Spacer(1, 10))
-    
-    elements.append(Paragraph("Important Considerations", subheading_style))
-    for consideration in dietary_plan.get('important_considerations', '').split('\n'):
-        if consideration.strip():
-            elements.append(Paragraph(f"• {consideration.strip()}", styles['Normal']))
-    
-    elements.append(Spacer(1, 20))
-    
-    # Fitness Plan
-    elements.append(Paragraph("Fitness Plan", heading_style))
-    elements.append(Spacer(1, 6))
-    
-    elements.append(Paragraph("Goals", subheading_style))
-    elements.append(Paragraph(fitness_plan.get('goals', ''), styles['Normal']))
-    elements.append(Spacer(1, 10))
-    
-    elements.append(Paragraph("Exercise Routine", subheading_style))
-    elements.append(Paragraph(fitness_plan.get('routine', ''), styles['Normal']))
-    elements.append(Spacer(1, 10))
-    
-    elements.append(Paragraph("Pro Tips", subheading_style))
-    for tip in fitness_plan.get('tips', '').split('\n'):
-        if tip.strip():
-            elements.append(Paragraph(f"• {tip.strip()}", styles['Normal']))
-    
-    # Build the PDF
-    doc.build(elements)
-    
-    buffer.seek(0)
-    return buffer
-
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,342 @@
+"""Shared wrapper around every agent call.
+
+Adds jittered exponential backoff for transient errors, per-call deadlines,
+optional hedged requests once a call runs past the stage's p95, a
+process-wide token bucket per API key and a circuit breaker per API key and
+model that fails fast while the backend is degraded.
+"""
+import concurrent.futures
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+
+import metrics
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+
+# Default Gemini request rate per API key (requests per second, burst size)
+RATE_LIMIT = float(os.environ.get("LLM_RATE_LIMIT", 5))
+RATE_BURST = int(os.environ.get("LLM_RATE_BURST", 10))
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+# Hedge a call once it has run longer than the stage's observed p95
+HEDGING_ENABLED = bool(os.environ.get("LLM_HEDGING"))
+HEDGE_MIN_SAMPLES = 20
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+_STATUS_NAMES = {"RESOURCE_EXHAUSTED": 429, "UNAVAILABLE": 503, "DEADLINE_EXCEEDED": 504, "INTERNAL": 500}
+_STATUS_IN_MESSAGE = re.compile(r"\b(408|429|500|502|503|504)\b")
+
+_call_executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the backend while its circuit breaker is open"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call's deadline passes before it succeeds"""
+
+
+def api_key_fingerprint(api_key):
+    """Stable identifier for an API key that doesn't keep the key itself in cache keys"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def error_status(error):
+    """Best-effort HTTP status of an API error, or None"""
+    for attribute in ("status_code", "code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            if value.isdigit():
+                return int(value)
+            if value in _STATUS_NAMES:
+                return _STATUS_NAMES[value]
+    message = str(error)
+    for name, status in _STATUS_NAMES.items():
+        if name in message:
+            return status
+    match = _STATUS_IN_MESSAGE.search(message)
+    return int(match.group(1)) if match else None
+
+
+def is_rate_limited(error):
+    """Whether an API error is a 429 / quota exhaustion"""
+    return error_status(error) == 429
+
+
+def is_retryable(error):
+    """Transient errors worth retrying: timeouts, connection failures, 429s and 5xx"""
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return error_status(error) in RETRYABLE_STATUSES
+
+
+def _counts_as_outage(error):
+    """Errors that say the backend is unhealthy, as opposed to a bad request or our own rate"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = error_status(error)
+    return status is not None and status >= 500
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Wait for a token; False if the deadline would pass first"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# What CircuitBreaker.allow returns for the trial call of a half-open breaker
+TRIAL = "trial"
+
+
+class CircuitBreaker:
+    """Opens after consecutive outage errors, then lets one trial call through after a cool-down"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """True to make a call, TRIAL for the one call let through while half-open, False to reject it"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return TRIAL
+            return False
+
+    def release(self, admitted):
+        """End a call allow() admitted without an outcome, e.g. one its caller cancelled or stopped"""
+        if admitted == TRIAL:
+            with self._lock:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self._trial_in_flight = False
+            if not _counts_as_outage(error):
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_limiters = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def _api_key_id(agent):
+    api_key = getattr(getattr(agent, "model", None), "api_key", None)
+    return api_key_fingerprint(api_key) if api_key else "default"
+
+
+def get_rate_limiter(api_key_id):
+    """Process-wide token bucket for an API key"""
+    with _registry_lock:
+        if api_key_id not in _limiters:
+            _limiters[api_key_id] = TokenBucket(RATE_LIMIT, RATE_BURST)
+        return _limiters[api_key_id]
+
+
+def configure_rate_limit(api_key, rate, burst):
+    """Override the token bucket for one API key, e.g. from a batch job's --rate"""
+    with _registry_lock:
+        _limiters[api_key_fingerprint(api_key)] = TokenBucket(rate, burst)
+
+
+def get_circuit_breaker(api_key_id, model_id):
+    """Process-wide circuit breaker for an API key and model"""
+    key = (api_key_id, model_id)
+    with _registry_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker()
+        return _breakers[key]
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _attempt(agent, prompt, stage, deadline, hedge):
+    """One call, raced against a hedged duplicate if it runs past the stage p95"""
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+    futures = [_call_executor.submit(agent.run, prompt)]
+    hedge_delay = None
+    if hedge and hasattr(agent, "deep_copy"):
+        hedge_delay = metrics.stage_percentile(stage, 95, min_samples=HEDGE_MIN_SAMPLES)
+    if hedge_delay is not None and (remaining is None or hedge_delay < remaining):
+        done, _ = concurrent.futures.wait(futures, timeout=hedge_delay)
+        if not done:
+            # Agents keep per-run state, so the duplicate runs on its own copy
+            futures.append(_call_executor.submit(agent.deep_copy().run, prompt))
+            metrics.count("hedged_requests", stage=stage)
+
+    pending = set(futures)
+    error = None
+    while pending:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = concurrent.futures.wait(
+            pending, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    if error is not None and not pending:
+        raise error
+    raise DeadlineExceeded(f"{stage} did not finish before its deadline")
+
+
+def call_agent(agent, prompt, stage="agent", timeout=None, max_retries=MAX_RETRIES, hedge=None):
+    """Run agent.run(prompt) with rate limiting, circuit breaking, deadlines, retries and hedging.
+
+    timeout bounds the whole call including retries and waits for the rate limiter.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    hedge = HEDGING_ENABLED if hedge is None else hedge
+    api_key_id = _api_key_id(agent)
+    limiter = get_rate_limiter(api_key_id)
+    breaker = get_circuit_breaker(api_key_id, getattr(agent.model, "id", None))
+
+    for attempt in range(max_retries + 1):
+        if not limiter.acquire(deadline):
+            raise DeadlineExceeded(f"{stage} could not be scheduled before its deadline")
+        admitted = breaker.allow()
+        if not admitted:
+            metrics.count("circuit_open_rejections", stage=stage)
+            raise CircuitOpenError("The AI service is temporarily unavailable, please try again shortly")
+        try:
+            with metrics.timed(stage):
+                response = _attempt(agent, prompt, stage, deadline, hedge)
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                # Interrupted rather than failed, so it says nothing about the backend
+                breaker.release(admitted)
+                raise
+            breaker.record_failure(e)
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            metrics.count("retries", stage=stage)
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            metrics.record_tokens(stage, response)
+            return response
+
+
+def stream_agent(agent, prompt, stage="agent", max_retries=MAX_RETRIES, deadline=None, stop=None):
+    """Yield agent.run(prompt, stream=True) chunks with the same protections as call_agent.
+
+    Failures are only retried before the first chunk; once output has been
+    shown it can't be taken back. Reading stops with DeadlineExceeded once the
+    deadline (a time.monotonic() value) passes, or quietly once the stop event
+    is set by a consumer that gave up, so an abandoned stream doesn't hold its
+    thread. A chunk that never arrives still can't be interrupted.
+    """
+    api_key_id = _api_key_id(agent)
+    limiter = get_rate_limiter(api_key_id)
+    breaker = get_circuit_breaker(api_key_id, getattr(agent.model, "id", None))
+
+    for attempt in range(max_retries + 1):
+        if not limiter.acquire(deadline):
+            raise DeadlineExceeded(f"{stage} could not be scheduled before its deadline")
+        admitted = breaker.allow()
+        if not admitted:
+            metrics.count("circuit_open_rejections", stage=stage)
+            raise CircuitOpenError("The AI service is temporarily unavailable, please try again shortly")
+        started = stopped = False
+        try:
+            with metrics.timed(stage):
+                stream = agent.run(prompt, stream=True)
+                try:
+                    for chunk in stream:
+                        if stop is not None and stop.is_set():
+                            stopped = True
+                            break
+                        if deadline is not None and time.monotonic() >= deadline:
+                            raise DeadlineExceeded(f"{stage} did not finish before its deadline")
+                        started = True
+                        yield chunk
+                finally:
+                    if hasattr(stream, "close"):
+                        stream.close()
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                # Closed by its consumer (GeneratorExit) rather than failed
+                breaker.release(admitted)
+                raise
+            breaker.record_failure(e)
+            if started or attempt == max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            metrics.count("retries", stage=stage)
+            time.sleep(delay)
+        else:
+            if stopped:
+                breaker.release(admitted)
+                return
+            breaker.record_success()
+            # The assembled response, with its token metrics, is left on the agent after streaming
+            metrics.record_tokens(stage, getattr(agent, "run_response", None))
+            return
@@ -0,0 +1,193 @@
+"""Lightweight in-process metrics: per-stage latency, tokens, cache hits and errors.
+
+Exposed as Prometheus text (render_prometheus, or an HTTP endpoint when
+METRICS_PORT is set) and as a periodic JSON log line when
+METRICS_LOG_INTERVAL is set, which suits Cloud Run's single public port.
+"""
+import collections
+import contextlib
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# Recent samples kept per stage for percentile estimates
+RESERVOIR_SIZE = 1024
+
+logger = logging.getLogger("health_agent.metrics")
+
+
+class _Stage:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds_total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = collections.deque(maxlen=RESERVOIR_SIZE)
+
+
+_stages = collections.defaultdict(_Stage)
+_counters = collections.defaultdict(float)
+_lock = threading.Lock()
+
+
+def observe(stage, seconds, error=False):
+    """Record one timed run of a stage"""
+    with _lock:
+        stats = _stages[stage]
+        stats.count += 1
+        stats.errors += int(error)
+        stats.seconds_total += seconds
+        stats.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stats.buckets[i] += 1
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Time a block as one run of a stage, counting it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        observe(stage, time.perf_counter() - start, error=True)
+        raise
+    observe(stage, time.perf_counter() - start)
+
+
+def count(name, value=1, **labels):
+    """Add to a labelled counter, e.g. count("cache", cache="plan", result="hit")"""
+    with _lock:
+        _counters[(name, tuple(sorted(labels.items())))] += value
+
+
+def _token_total(value):
+    if isinstance(value, (list, tuple)):
+        return sum(item or 0 for item in value)
+    return value or 0
+
+
+def record_tokens(stage, response):
+    """Count prompt/completion tokens reported in an agent response's metrics"""
+    run_metrics = getattr(response, "metrics", None)
+    if not run_metrics:
+        return
+    if isinstance(run_metrics, dict):
+        get = run_metrics.get
+    else:
+        get = lambda key: getattr(run_metrics, key, None)
+    prompt_tokens = _token_total(get("input_tokens") or get("prompt_tokens"))
+    completion_tokens = _token_total(get("output_tokens") or get("completion_tokens"))
+    if prompt_tokens:
+        count("tokens", prompt_tokens, stage=stage, kind="prompt")
+    if completion_tokens:
+        count("tokens", completion_tokens, stage=stage, kind="completion")
+
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def stage_percentile(stage, q, min_samples=1):
+    """Recent q-th percentile latency of a stage in seconds, or None with too few samples"""
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None or len(stats.recent) < min_samples:
+            return None
+        return _percentile(stats.recent, q)
+
+
+def snapshot():
+    """Current metrics as plain data"""
+    with _lock:
+        stages = {
+            stage: {
+                "count": stats.count,
+                "errors": stats.errors,
+                "mean_s": round(stats.seconds_total / stats.count, 4) if stats.count else None,
+                "p50_s": round(_percentile(stats.recent, 50), 4) if stats.recent else None,
+                "p95_s": round(_percentile(stats.recent, 95), 4) if stats.recent else None,
+                "p99_s": round(_percentile(stats.recent, 99), 4) if stats.recent else None,
+            }
+            for stage, stats in _stages.items()
+        }
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in _counters.items()
+        ]
+    return {"stages": stages, "counters": counters}
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+def render_prometheus():
+    """Metrics in the Prometheus text exposition format"""
+    lines = ["# TYPE health_agent_stage_seconds histogram"]
+    with _lock:
+        for stage, stats in sorted(_stages.items()):
+            # Buckets are already cumulative: observe() counts a sample in every bucket it fits
+            for bound, bucket_count in zip(BUCKETS, stats.buckets):
+                lines.append(f'health_agent_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+            lines.append(f'health_agent_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.count}')
+            lines.append(f'health_agent_stage_seconds_sum{{stage="{stage}"}} {stats.seconds_total}')
+            lines.append(f'health_agent_stage_seconds_count{{stage="{stage}"}} {stats.count}')
+        lines.append("# TYPE health_agent_stage_errors_total counter")
+        for stage, stats in sorted(_stages.items()):
+            lines.append(f'health_agent_stage_errors_total{{stage="{stage}"}} {stats.errors}')
+        for name in sorted({name for name, _ in _counters}):
+            lines.append(f"# TYPE health_agent_{name}_total counter")
+            for (counter_name, labels), value in sorted(_counters.items()):
+                if counter_name == name:
+                    lines.append(f"health_agent_{name}_total{{{_labels(labels)}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the app logs
+
+
+def _log_periodically(interval):
+    while True:
+        time.sleep(interval)
+        logger.info(json.dumps({"metrics": snapshot()}))
+
+
+_exporters_started = False
+
+
+def start_exporters():
+    """Start the /metrics endpoint and JSON logger configured by environment, once per process"""
+    global _exporters_started
+    with _lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    port = os.environ.get("METRICS_PORT")
+    if port:
+        server = http.server.ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    interval = os.environ.get("METRICS_LOG_INTERVAL")
+    if interval:
+        logging.basicConfig(level=logging.INFO)
+        threading.Thread(target=_log_periodically, args=(float(interval),), name="metrics-log", daemon=True).start()
@@ -0,0 +1,235 @@
+"""Multi-day programs, generated as one sub-request per day that all share a compact outline.
+
+A single call asked for a week or four weeks of plans is slow and often cut
+short. Instead, the outline is built locally: each week's phase, each day's
+workout focus and the ingredients each menu day features. Every day is then
+generated as an ordinary single-day plan, a bounded number at a time, and
+the days are reassembled in order into plans with a "days" list. Menus repeat
+weekly, while workouts progress through the whole program.
+"""
+import concurrent.futures
+import os
+
+import catalog
+from llm_calls import MAX_RETRIES
+from plan_generation import (
+    IMPORTANT_CONSIDERATIONS,
+    PLAN_LENGTHS,
+    PRO_TIPS,
+    WHY_THIS_PLAN_WORKS,
+    generate_plans,
+    make_dietary_plan,
+    make_fitness_plan,
+)
+
+# Days generated at once for one program, so a long one doesn't take the whole agent pool
+DAY_CONCURRENCY = int(os.environ.get("PLAN_DAY_CONCURRENCY", 4))
+
+MENU_CYCLE_DAYS = 7
+FEATURED_PER_DAY = 3
+
+# Progress name kind marking a finished day
+DONE = "done"
+
+# Weekly workout focus by fitness goal, Monday first
+WORKOUT_SPLITS = {
+    "Lose Weight": ["Full-body circuit", "Steady cardio", "Lower body strength", "Active recovery",
+                    "Upper body strength", "Cardio intervals", "Rest"],
+    "Gain Muscle": ["Upper body push", "Lower body", "Rest", "Upper body pull", "Lower body", "Full-body strength",
+                    "Rest"],
+    "Endurance": ["Steady cardio", "Strength endurance", "Tempo cardio", "Active recovery", "Cardio intervals",
+                  "Long steady cardio", "Rest"],
+    "Stay Fit": ["Full-body strength", "Steady cardio", "Mobility and balance", "Full-body strength",
+                 "Active recovery", "Recreational activity", "Rest"],
+    "Strength Training": ["Lower body strength", "Upper body strength", "Rest", "Lower body strength",
+                          "Upper body strength", "Mobility and balance", "Rest"],
+    "Manage Medical Conditions": ["Gentle cardio", "Mobility and balance", "Light strength", "Rest",
+                                  "Gentle cardio", "Light strength", "Rest"],
+}
+
+# Phase of each week of a longer program
+PHASES = ["Foundation", "Build", "Progress", "Deload"]
+
+
+def plan_length(profile):
+    return int(profile.get("plan_days") or 1)
+
+
+def build_outline(profile):
+    """Phase, workout focus and featured ingredients for each day of the profile's program"""
+    days = plan_length(profile)
+    split = WORKOUT_SPLITS.get(profile["fitness_goals"], WORKOUT_SPLITS["Stay Fit"])
+    ingredients = catalog.shortlist(profile)["ingredients"]
+    outline = []
+    for i in range(days):
+        menu_day = i % MENU_CYCLE_DAYS
+        featured = [ingredients[(menu_day * FEATURED_PER_DAY + k) % len(ingredients)]
+                    for k in range(min(FEATURED_PER_DAY, len(ingredients)))]
+        outline.append({
+            "day": i + 1,
+            "week": i // 7 + 1,
+            "phase": PHASES[(i // 7) % len(PHASES)] if days > 7 else None,
+            "workout": split[i % len(split)],
+            "menu_day": menu_day + 1,
+            "featured": featured,
+        })
+    return outline
+
+
+def outline_prompt(outline):
+    """The whole program in a few lines, shared by every day's sub-request"""
+    lines = [f"Program Length: {len(outline)} days"]
+    week = [entry["workout"] for entry in outline[:7]]
+    lines.append("Weekly Workout Split: " + "; ".join(f"Day {i + 1} {focus}" for i, focus in enumerate(week)))
+    phases = sorted({(entry["week"], entry["phase"]) for entry in outline if entry["phase"]})
+    if phases:
+        lines.append("Phases: " + "; ".join(f"Week {week} {phase}" for week, phase in phases))
+    menus = [entry for entry in outline[:MENU_CYCLE_DAYS] if entry["featured"]]
+    if menus:
+        lines.append("Menu Rotation: " + "; ".join(
+            f"Day {entry['menu_day']} {', '.join(entry['featured'])}" for entry in menus
+        ))
+    return "\n".join(lines)
+
+
+def day_prompt(entry, total):
+    phase = f", Week {entry['week']} {entry['phase']} phase" if entry["phase"] else ""
+    return "\n".join([
+        f"Program Day: {entry['day']} of {total}{phase}",
+        f"Workout Focus: {entry['workout']}",
+        f"Menu Day: {entry['menu_day']}, featuring {', '.join(entry['featured']) or 'local produce'}",
+    ])
+
+
+def day_title(kind, entry, total):
+    if kind == "dietary":
+        repeats = [str(day) for day in range(entry["day"] + MENU_CYCLE_DAYS, total + 1, MENU_CYCLE_DAYS)]
+        return f"Day {entry['day']}" + (f" (also days {', '.join(repeats)})" if repeats else "")
+    phase = f", Week {entry['week']} {entry['phase']}" if entry["phase"] else ""
+    return f"Day {entry['day']}{phase}: {entry['workout']}"
+
+
+def days_done(progress):
+    return sum(1 for name in list(progress) if parse_progress_name(name)[0] == DONE)
+
+
+def progress_name(kind, day):
+    """on_chunk name for one day's output, e.g. "fitness:3" """
+    return f"{kind}:{day}"
+
+
+def parse_progress_name(name):
+    kind, _, day = name.partition(":")
+    return kind, int(day) if day.isdigit() else None
+
+
+def _unique(items):
+    return list(dict.fromkeys(items))
+
+
+def assemble(kind, day_plans, outline):
+    """One plan with a "days" list from per-day plans {day: plan}, in day order; None if no day succeeded"""
+    if not day_plans:
+        return None
+    total = len(outline)
+    days = []
+    for entry in outline:
+        plan = day_plans.get(entry["day"])
+        if plan is None:
+            continue
+        fields = ("meals", "meal_plan") if kind == "dietary" else ("sessions", "routine")
+        day = {"day": entry["day"], "title": day_title(kind, entry, total)}
+        day.update({field: plan[field] for field in fields if plan.get(field)})
+        days.append(day)
+    plans = [day_plans[day["day"]] for day in days]
+    if kind == "dietary":
+        return {
+            "why_this_plan_works": next(
+                (plan["why_this_plan_works"] for plan in plans if plan.get("why_this_plan_works")), WHY_THIS_PLAN_WORKS
+            ),
+            "plan_days": total,
+            "days": days,
+            "important_considerations": _unique(
+                item for plan in plans for item in plan.get("important_considerations", IMPORTANT_CONSIDERATIONS)
+            ),
+        }
+    return {
+        "goals": plans[0].get("goals"),
+        "plan_days": total,
+        "days": days,
+        "tips": _unique(item for plan in plans for item in plan.get("tips", PRO_TIPS)),
+    }
+
+
+def generate_program(build_agents, user_profile, profile, timeouts=None, cache=None, on_chunk=None,
+                     max_retries=MAX_RETRIES):
+    """Generate a multi-day program: (dietary_plan, fitness_plan, errors) like generate_plans.
+
+    build_agents() returns a fresh (dietary, fitness) agent pair; agents keep
+    per-run state, so each day gets its own. Days run DAY_CONCURRENCY at a time.
+    With on_chunk, each day's output is streamed under progress_name(kind, day),
+    from the worker thread generating that day, and each finished day is
+    reported under progress_name(DONE, day).
+    """
+    outline = build_outline(profile)
+    shared = f"{user_profile}\n{outline_prompt(outline)}"
+
+    def generate_day(entry):
+        dietary_agent, fitness_agent = build_agents()
+        if entry["day"] > MENU_CYCLE_DAYS:
+            dietary_agent = None  # The menu repeats weekly
+
+        def day_chunk(name, text):
+            on_chunk(progress_name(name, entry["day"]), text)
+
+        # Each day is its own profile for the plan cache
+        day_profile = dict(profile, program_day=entry["day"])
+        return generate_plans(
+            dietary_agent, fitness_agent, f"{shared}\n{day_prompt(entry, len(outline))}", day_profile,
+            timeouts=timeouts, cache=cache, on_chunk=day_chunk if on_chunk is not None else None,
+            max_retries=max_retries,
+        )
+
+    dietary_days, fitness_days, errors = {}, {}, {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DAY_CONCURRENCY, thread_name_prefix="plan-day") as pool:
+        futures = {pool.submit(generate_day, entry): entry["day"] for entry in outline}
+        for future in concurrent.futures.as_completed(futures):
+            day = futures[future]
+            try:
+                dietary_plan, fitness_plan, day_errors = future.result()
+            except Exception as e:
+                day_errors = {"dietary": e, "fitness": e}
+                dietary_plan = fitness_plan = None
+            if dietary_plan is not None:
+                dietary_days[day] = dietary_plan
+            if fitness_plan is not None:
+                fitness_days[day] = fitness_plan
+            for name, error in day_errors.items():
+                if name == "fitness" or day <= MENU_CYCLE_DAYS:
+                    errors[f"{name} day {day}"] = error
+            if on_chunk is not None:
+                on_chunk(progress_name(DONE, day), DONE)
+
+    return (
+        assemble("dietary", dietary_days, outline),
+        assemble("fitness", fitness_days, outline),
+        errors,
+    )
+
+
+def assemble_progress(progress, profile):
+    """Plans from the days streamed so far, for display while a program is generated: (dietary, fitness)"""
+    outline = build_outline(profile)
+    days = {"dietary": {}, "fitness": {}}
+    for name, text in list(progress.items()):
+        kind, day = parse_progress_name(name)
+        if day is None or kind not in days:
+            continue
+        if kind == "dietary":
+            days[kind][day] = make_dietary_plan(text, partial=True)
+        else:
+            days[kind][day] = make_fitness_plan(text, profile, partial=True)
+    return (
+        assemble("dietary", days["dietary"], outline) or {},
+        assemble("fitness", days["fitness"], outline) or {},
+    )
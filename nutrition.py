@@ -0,0 +1,138 @@
+"""Daily energy and macro targets computed locally, for one profile or a whole batch at once.
+
+BMR uses the Mifflin-St Jeor equation, TDEE applies the usual activity
+multipliers, and the goal and medical conditions adjust calories and the
+macro split. The numbers are put in the agents' prompt, so the model plans
+meals around them instead of doing the arithmetic itself.
+"""
+import numpy as np
+
+ACTIVITY_FACTORS = {
+    "Sedentary": 1.2,
+    "Lightly Active": 1.375,
+    "Moderately Active": 1.55,
+    "Very Active": 1.725,
+    "Extremely Active": 1.9,
+}
+
+# Mifflin-St Jeor sex constant; "Other" uses the midpoint
+SEX_CONSTANTS = {"Male": 5.0, "Female": -161.0, "Other": -78.0}
+
+# Daily calorie change from TDEE and protein per kg of body weight, by fitness goal
+GOAL_CALORIE_ADJUSTMENTS = {
+    "Lose Weight": -500.0,
+    "Gain Muscle": 300.0,
+    "Endurance": 200.0,
+    "Stay Fit": 0.0,
+    "Strength Training": 200.0,
+    "Manage Medical Conditions": 0.0,
+}
+GOAL_PROTEIN_PER_KG = {
+    "Lose Weight": 1.6,
+    "Gain Muscle": 1.8,
+    "Endurance": 1.4,
+    "Stay Fit": 1.2,
+    "Strength Training": 1.8,
+    "Manage Medical Conditions": 1.0,
+}
+
+FAT_SHARE = 0.30
+# Share of calories from carbohydrate is capped for diabetes
+DIABETES_CARB_SHARE = 0.40
+FIBER_PER_1000_KCAL = 14.0
+SODIUM_LIMIT_MG = 2300.0
+LOW_SODIUM_LIMIT_MG = 1500.0
+LOW_SODIUM_CONDITIONS = {"Hypertension", "Heart Disease"}
+# Don't recommend less than this without medical supervision
+MIN_CALORIES = {"Male": 1500.0, "Female": 1200.0, "Other": 1350.0}
+
+KCAL_PER_GRAM = {"protein": 4.0, "carbs": 4.0, "fat": 9.0}
+
+BMI_CATEGORIES = ((18.5, "Underweight"), (25.0, "Normal"), (30.0, "Overweight"), (np.inf, "Obese"))
+
+
+def _lookup(values, table, default):
+    return np.array([table.get(value, table[default]) for value in values], dtype=np.float64)
+
+
+def compute_targets(age, weight, height, sex, activity_level, fitness_goals, medical_conditions):
+    """Targets for a batch of profiles given as parallel sequences; returns a dict of arrays.
+
+    medical_conditions is a sequence of lists. Weight is in kg and height in cm.
+    """
+    age = np.asarray(age, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    diabetic = np.array(["Diabetes" in conditions for conditions in medical_conditions])
+    low_sodium = np.array([bool(LOW_SODIUM_CONDITIONS.intersection(conditions)) for conditions in medical_conditions])
+
+    bmi = weight / (height / 100.0) ** 2
+    bmr = 10.0 * weight + 6.25 * height - 5.0 * age + _lookup(sex, SEX_CONSTANTS, "Other")
+    tdee = bmr * _lookup(activity_level, ACTIVITY_FACTORS, "Moderately Active")
+    calories = np.maximum(
+        tdee + _lookup(fitness_goals, GOAL_CALORIE_ADJUSTMENTS, "Stay Fit"),
+        _lookup(sex, MIN_CALORIES, "Other"),
+    )
+
+    protein_g = weight * _lookup(fitness_goals, GOAL_PROTEIN_PER_KG, "Stay Fit")
+    fat_kcal = calories * FAT_SHARE
+    carbs_kcal = np.maximum(calories - protein_g * KCAL_PER_GRAM["protein"] - fat_kcal, 0.0)
+    # With diabetes, carbohydrate above the cap moves to fat
+    capped_carbs_kcal = np.where(diabetic, np.minimum(carbs_kcal, calories * DIABETES_CARB_SHARE), carbs_kcal)
+    fat_kcal = fat_kcal + carbs_kcal - capped_carbs_kcal
+
+    return {
+        "bmi": bmi,
+        "bmr": bmr,
+        "tdee": tdee,
+        "calories": calories,
+        "protein_g": protein_g,
+        "carbs_g": capped_carbs_kcal / KCAL_PER_GRAM["carbs"],
+        "fat_g": fat_kcal / KCAL_PER_GRAM["fat"],
+        "fiber_g": calories / 1000.0 * FIBER_PER_1000_KCAL,
+        "sodium_mg": np.where(low_sodium, LOW_SODIUM_LIMIT_MG, SODIUM_LIMIT_MG),
+    }
+
+
+def bmi_category(bmi):
+    for upper, name in BMI_CATEGORIES:
+        if bmi < upper:
+            return name
+
+
+def batch_targets(profiles):
+    """Targets for a list of profile dicts, computed in one vectorized pass; one dict per profile"""
+    if not profiles:
+        return []
+    columns = {
+        field: [profile[field] for profile in profiles]
+        for field in ("age", "weight", "height", "sex", "activity_level", "fitness_goals", "medical_conditions")
+    }
+    arrays = compute_targets(**columns)
+    targets = [
+        {name: round(float(values[i]), 1) for name, values in arrays.items()}
+        for i in range(len(profiles))
+    ]
+    for target in targets:
+        target["bmi_category"] = bmi_category(target["bmi"])
+    return targets
+
+
+def profile_targets(profile):
+    """Targets for a single profile dict"""
+    return batch_targets([profile])[0]
+
+
+def targets_prompt(targets):
+    """Prompt lines stating the computed targets, in the same "Label: value" form as the profile"""
+    return "\n".join([
+        f"BMI: {targets['bmi']:.1f} ({targets['bmi_category']})",
+        f"BMR: {targets['bmr']:.0f} kcal",
+        f"Maintenance Calories (TDEE): {targets['tdee']:.0f} kcal",
+        f"Daily Calorie Target: {targets['calories']:.0f} kcal",
+        f"Daily Protein Target: {targets['protein_g']:.0f} g",
+        f"Daily Carbohydrate Target: {targets['carbs_g']:.0f} g",
+        f"Daily Fat Target: {targets['fat_g']:.0f} g",
+        f"Daily Fiber Target: {targets['fiber_g']:.0f} g",
+        f"Daily Sodium Limit: {targets['sodium_mg']:.0f} mg",
+    ])
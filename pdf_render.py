@@ -0,0 +1,169 @@
+import functools
+import re
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET = re.compile(r"^(\s*)([-*+•]|\d+[.)])\s+(.*)$")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+_TABLE_RULE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+_BOLD = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+_ITALIC = re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?!\*)")
+_CODE = re.compile(r"`([^`]+)`")
+
+
+@functools.lru_cache(maxsize=None)
+def get_styles():
+    """Process-wide paragraph and table styles, built on first use"""
+    base = getSampleStyleSheet()
+    styles = {
+        "normal": base["Normal"],
+        "title": ParagraphStyle(
+            'Title',
+            parent=base['Title'],
+            fontSize=16,
+            textColor=colors.darkblue,
+            spaceAfter=12
+        ),
+        "heading": ParagraphStyle(
+            'Heading',
+            parent=base['Heading2'],
+            fontSize=14,
+            textColor=colors.darkblue,
+            spaceAfter=6
+        ),
+        "subheading": ParagraphStyle(
+            'SubHeading',
+            parent=base['Heading3'],
+            fontSize=12,
+            textColor=colors.darkslateblue,
+            spaceAfter=6
+        ),
+        "day": ParagraphStyle(
+            'Day',
+            parent=base['Heading3'],
+            fontSize=11,
+            textColor=colors.darkblue,
+            spaceBefore=8,
+            spaceAfter=4
+        ),
+        "section": ParagraphStyle(
+            'Section',
+            parent=base['Heading4'],
+            textColor=colors.darkslateblue,
+            spaceBefore=6,
+            spaceAfter=3
+        ),
+        "body": ParagraphStyle('Body', parent=base['Normal'], spaceAfter=4),
+        "table_cell": ParagraphStyle('TableCell', parent=base['Normal'], fontSize=9, leading=11),
+    }
+    for level in range(3):
+        styles[f"bullet{level}"] = ParagraphStyle(
+            f'Bullet{level}',
+            parent=base['Normal'],
+            leftIndent=14 + 14 * level,
+            bulletIndent=4 + 14 * level,
+            spaceAfter=2
+        )
+    styles["profile_table"] = TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.darkblue),
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.lightgrey),
+    ])
+    styles["markdown_table"] = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ])
+    return styles
+
+
+def inline_markup(text):
+    """Escape text for ReportLab and convert markdown bold, italics and code"""
+    text = escape(text.strip())
+    text = _BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = _ITALIC.sub(r"<i>\1</i>", text)
+    return _CODE.sub(r'<font name="Courier">\1</font>', text)
+
+
+def _table(rows, styles):
+    cells = [[Paragraph(inline_markup(cell), styles["table_cell"]) for cell in row] for row in rows]
+    width = max(len(row) for row in cells)
+    cells = [row + [""] * (width - len(row)) for row in cells]
+    table = Table(cells, colWidths=[500 / width] * width, repeatRows=1)
+    table.setStyle(styles["markdown_table"])
+    return table
+
+
+def table_flowable(rows):
+    """A table of text cells, header row first, in the plan table style"""
+    return _table(rows, get_styles())
+
+
+def bullet_flowables(items):
+    """One bullet paragraph per item"""
+    style = get_styles()["bullet0"]
+    return [Paragraph(inline_markup(item), style, bulletText="•") for item in items if item.strip()]
+
+
+def markdown_to_flowables(text):
+    """Convert plan markdown into small flowables: headings, bullets, paragraphs and tables.
+
+    Keeping each flowable small lets ReportLab lay out and split pages cheaply,
+    instead of reflowing one multi-kilobyte paragraph.
+    """
+    styles = get_styles()
+    flowables = []
+    paragraph, table_rows = [], []
+
+    def flush_paragraph():
+        if paragraph:
+            flowables.append(Paragraph(inline_markup(" ".join(paragraph)), styles["body"]))
+            paragraph.clear()
+
+    def flush_table():
+        if table_rows:
+            flowables.append(_table(table_rows, styles))
+            table_rows.clear()
+
+    for line in (text or "").split("\n"):
+        if _TABLE_ROW.match(line):
+            flush_paragraph()
+            if not _TABLE_RULE.match(line):
+                table_rows.append([cell.strip() for cell in line.strip().strip("|").split("|")])
+            continue
+        flush_table()
+
+        if not line.strip():
+            flush_paragraph()
+            continue
+        heading = _HEADING.match(line.strip())
+        bullet = _BULLET.match(line)
+        if heading:
+            flush_paragraph()
+            flowables.append(Paragraph(inline_markup(heading.group(2)), styles["section"]))
+        elif bullet:
+            flush_paragraph()
+            level = min(len(bullet.group(1).expandtabs(4)) // 2, 2)
+            marker = bullet.group(2)
+            marker = "•" if marker in "-*+•" else marker
+            flowables.append(Paragraph(inline_markup(bullet.group(3)), styles[f"bullet{level}"], bulletText=marker))
+        else:
+            paragraph.append(line.strip())
+    flush_paragraph()
+    flush_table()
+    return flowables
+
+
+def build_pdf(flowables, output):
+    """Lay out flowables into output (a path or binary file object) in a single pass"""
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    doc.build(flowables)
+    return output
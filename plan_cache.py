@@ -0,0 +1,166 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Numeric fields are bucketed so near-identical profiles share a cache entry
+PROFILE_BUCKETS = {"age": 1, "weight": 1.0, "height": 1.0}
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def _bucket(value, size):
+    return round(float(value) / size) * size
+
+
+def normalize_profile(profile):
+    """Canonical form of a profile dict for hashing"""
+    normalized = {}
+    for field, value in profile.items():
+        if field in PROFILE_BUCKETS:
+            normalized[field] = _bucket(value, PROFILE_BUCKETS[field])
+        elif isinstance(value, (list, tuple)):
+            normalized[field] = sorted(str(item).strip().casefold() for item in value)
+        elif isinstance(value, str):
+            normalized[field] = value.strip().casefold()
+        else:
+            normalized[field] = value
+    return normalized
+
+
+def plan_cache_key(profile, instructions, model_id):
+    """Content hash of the normalized profile, the agent instructions and the model id"""
+    payload = json.dumps(
+        {"profile": normalize_profile(profile), "instructions": list(instructions), "model": model_id},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def agent_cache_key(agent, profile):
+    """Cache key for one agent's answer to a profile"""
+    return plan_cache_key(profile, agent.instructions or [], getattr(agent.model, "id", None))
+
+
+class MemoryPlanCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self), "hits": self.hits, "misses": self.misses}
+
+
+class SQLitePlanCache:
+    """On-disk cache that survives restarts, evicting least recently used entries"""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plan_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plan_cache_accessed ON plan_cache (accessed)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM plan_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM plan_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE plan_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plan_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM plan_cache WHERE key IN ("
+                "SELECT key FROM plan_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM plan_cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM plan_cache").fetchone()[0]
+
+    def stats(self):
+        return {"backend": "sqlite", "entries": len(self), "hits": self.hits, "misses": self.misses}
+
+
+_plan_cache = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache():
+    """Process-wide plan cache configured from the PLAN_CACHE_* environment variables"""
+    global _plan_cache
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            max_entries = int(os.environ.get("PLAN_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+            ttl = float(os.environ.get("PLAN_CACHE_TTL", DEFAULT_TTL))
+            if os.environ.get("PLAN_CACHE_BACKEND", "memory") == "sqlite":
+                path = os.environ.get("PLAN_CACHE_PATH", "plan_cache.sqlite3")
+                _plan_cache = SQLitePlanCache(path, max_entries=max_entries, ttl=ttl)
+            else:
+                _plan_cache = MemoryPlanCache(max_entries=max_entries, ttl=ttl)
+        return _plan_cache
@@ -0,0 +1,188 @@
+import io
+import json
+from reportlab.platypus import Paragraph, Spacer, Table
+from pdf_render import build_pdf, bullet_flowables, get_styles, inline_markup, markdown_to_flowables, table_flowable
+from plan_format import (
+    daily_totals,
+    meal_plan_markdown,
+    meal_rows,
+    meal_title,
+    plan_days,
+    routine_markdown,
+    session_rows,
+    session_title,
+    totals_text,
+)
+
+def create_plan_text(dietary_plan, fitness_plan, user_profile):
+    """Format plans as plain text"""
+    text_content = "=== YOUR PERSONALIZED HEALTH & FITNESS PLAN ===\n\n"
+    
+    # Add user profile summary
+    text_content += "=== USER PROFILE ===\n"
+    for line in user_profile.strip().split("\n"):
+        if line.strip():
+            text_content += f"{line.strip()}\n"
+    
+    # Add dietary plan
+    text_content += "\n\n=== DIETARY PLAN ===\n"
+    text_content += f"\nWHY THIS PLAN WORKS:\n{dietary_plan.get('why_this_plan_works', '')}\n"
+    text_content += f"\nMEAL PLAN:\n{meal_plan_markdown(dietary_plan)}\n"
+    text_content += "\nIMPORTANT CONSIDERATIONS:\n"
+    text_content += _as_bullets(dietary_plan.get('important_considerations', [])) + "\n"
+    
+    # Add fitness plan
+    text_content += "\n\n=== FITNESS PLAN ===\n"
+    text_content += f"\nGOALS:\n{fitness_plan.get('goals', '')}\n"
+    text_content += f"\nEXERCISE ROUTINE:\n{routine_markdown(fitness_plan)}\n"
+    text_content += "\nPRO TIPS:\n"
+    text_content += _as_bullets(fitness_plan.get('tips', [])) + "\n"
+    
+    return text_content
+
+def create_plan_markdown(dietary_plan, fitness_plan, user_profile):
+    """Format plans as Markdown"""
+    md_content = "# Your Personalized Health & Fitness Plan\n\n## User Profile\n\n"
+    for line in user_profile.strip().split("\n"):
+        if line.strip():
+            md_content += f"- {line.strip()}\n"
+
+    md_content += "\n## Dietary Plan\n"
+    md_content += f"\n### Why This Plan Works\n\n{dietary_plan.get('why_this_plan_works', '')}\n"
+    md_content += f"\n### Meal Plan\n\n{meal_plan_markdown(dietary_plan)}\n"
+    md_content += f"\n### Important Considerations\n\n{_as_bullets(dietary_plan.get('important_considerations', []))}\n"
+
+    md_content += "\n## Fitness Plan\n"
+    md_content += f"\n### Goals\n\n{fitness_plan.get('goals', '')}\n"
+    md_content += f"\n### Exercise Routine\n\n{routine_markdown(fitness_plan)}\n"
+    md_content += f"\n### Pro Tips\n\n{_as_bullets(fitness_plan.get('tips', []))}\n"
+    return md_content
+
+def create_plan_json(dietary_plan, fitness_plan, user_profile):
+    """Format plans as JSON"""
+    profile = {}
+    for line in user_profile.strip().split("\n"):
+        key_value = line.strip().split(":", 1)
+        if len(key_value) == 2:
+            profile[key_value[0].strip()] = key_value[1].strip()
+    return json.dumps(
+        {"user_profile": profile, "dietary_plan": dietary_plan, "fitness_plan": fitness_plan},
+        ensure_ascii=False,
+        indent=2,
+    )
+
+def create_plan_pdf(dietary_plan, fitness_plan, user_profile, output=None):
+    """Create a PDF document with formatted plans.
+
+    Written to output (a path or binary file object) when given, which keeps
+    very long plans out of memory; otherwise returned as a BytesIO.
+    """
+    styles = get_styles()
+    normal = styles['normal']
+    
+    # Build the document content
+    elements = []
+    
+    # Title
+    elements.append(Paragraph("Your Personalized Health & Fitness Plan", styles['title']))
+    elements.append(Spacer(1, 12))
+    
+    # User Profile
+    elements.append(Paragraph("User Profile", styles['heading']))
+    
+    # Format profile as table
+    profile_data = []
+    for line in user_profile.strip().split("\n"):
+        if line.strip():
+            key_value = line.strip().split(":", 1)
+            if len(key_value) == 2:
+                profile_data.append([key_value[0].strip(), key_value[1].strip()])
+    
+    if profile_data:
+        profile_table = Table(profile_data, colWidths=[150, 350])
+        profile_table.setStyle(styles['profile_table'])
+        elements.append(profile_table)
+    
+    elements.append(Spacer(1, 20))
+    
+    # Dietary Plan
+    elements.append(Paragraph("Dietary Plan", styles['heading']))
+    elements.append(Spacer(1, 6))
+    
+    elements.append(Paragraph("Why This Plan Works", styles['subheading']))
+    elements.append(Paragraph(inline_markup(dietary_plan.get('why_this_plan_works', '')), normal))
+    elements.append(Spacer(1, 10))
+    
+    elements.append(Paragraph("Meal Plan", styles['subheading']))
+    elements.extend(_meal_flowables(dietary_plan))
+    elements.append(Spacer(1, 10))
+    
+    elements.append(Paragraph("Important Considerations", styles['subheading']))
+    elements.extend(bullet_flowables(dietary_plan.get('important_considerations', [])))
+    
+    elements.append(Spacer(1, 20))
+    
+    # Fitness Plan
+    elements.append(Paragraph("Fitness Plan", styles['heading']))
+    elements.append(Spacer(1, 6))
+    
+    elements.append(Paragraph("Goals", styles['subheading']))
+    elements.append(Paragraph(inline_markup(fitness_plan.get('goals', '')), normal))
+    elements.append(Spacer(1, 10))
+    
+    elements.append(Paragraph("Exercise Routine", styles['subheading']))
+    elements.extend(_routine_flowables(fitness_plan))
+    elements.append(Spacer(1, 10))
+    
+    elements.append(Paragraph("Pro Tips", styles['subheading']))
+    elements.extend(bullet_flowables(fitness_plan.get('tips', [])))
+    
+    # Build the PDF
+    if output is not None:
+        return build_pdf(elements, output)
+    buffer = build_pdf(elements, io.BytesIO())
+    buffer.seek(0)
+    return buffer
+
+def _meal_flowables(dietary_plan):
+    """One table per meal, under a heading per day, built from the plan fields; raw markdown is converted as text"""
+    styles = get_styles()
+    elements = []
+    for title, day in plan_days(dietary_plan):
+        if title:
+            elements.append(Paragraph(inline_markup(title), styles['day']))
+        meals = [meal for meal in day.get('meals', []) if meal]
+        if not meals:
+            elements.extend(markdown_to_flowables(day.get('meal_plan', '')))
+            continue
+        for meal in meals:
+            elements.append(Paragraph(inline_markup(meal_title(meal)), styles['section']))
+            if meal.get('items'):
+                elements.append(table_flowable(meal_rows(meal)))
+            if meal.get('notes'):
+                elements.append(Paragraph(inline_markup(meal['notes']), styles['body']))
+        totals = daily_totals(day)
+        if totals:
+            elements.append(Paragraph(f"<b>Daily total:</b> {totals_text(totals)}", styles['body']))
+    return elements
+
+def _routine_flowables(fitness_plan):
+    """One table per workout session, under a heading per day, built from the plan fields"""
+    styles = get_styles()
+    elements = []
+    for title, day in plan_days(fitness_plan):
+        if title:
+            elements.append(Paragraph(inline_markup(title), styles['day']))
+        sessions = [session for session in day.get('sessions', []) if session]
+        if not sessions:
+            elements.extend(markdown_to_flowables(day.get('routine', '')))
+            continue
+        for session in sessions:
+            elements.append(Paragraph(inline_markup(session_title(session)), styles['section']))
+            if session.get('exercises'):
+                elements.append(table_flowable(session_rows(session)))
+    return elements
+
+def _as_bullets(items):
+    """Markdown bullet list"""
+    return "\n".join(f"- {item.strip()}" for item in items if item.strip())
@@ -0,0 +1,179 @@
+"""Text renderings of structured plan dicts, shared by the UI, exports and Q&A.
+
+Plans whose agent output couldn't be parsed keep the raw markdown in
+meal_plan / routine, which is used as-is.
+"""
+
+MACROS = (("calories", "kcal"), ("protein_g", "protein g"), ("carbs_g", "carbs g"), ("fat_g", "fat g"))
+
+MEAL_COLUMNS = ["Item", "Portion", "kcal", "Protein (g)", "Carbs (g)", "Fat (g)"]
+EXERCISE_COLUMNS = ["Exercise", "Sets", "Reps", "Minutes", "Notes"]
+
+
+def _number(value):
+    if value is None:
+        return ""
+    return f"{value:g}"
+
+
+def _title(name, detail=None):
+    return f"{name} ({detail})" if detail else name
+
+
+def meal_title(meal):
+    return _title(meal.get("name") or "Meal", meal.get("time"))
+
+
+def meal_rows(meal):
+    """Table rows (header first) for one meal's items"""
+    rows = [MEAL_COLUMNS]
+    for item in meal.get("items", []):
+        rows.append([item.get("name", ""), item.get("portion", "")] + [_number(item.get(field)) for field, _ in MACROS])
+    return rows
+
+
+def session_title(session):
+    minutes = session.get("duration_minutes")
+    return _title(session.get("name") or "Session", f"{_number(minutes)} min" if minutes else None)
+
+
+def session_rows(session):
+    """Table rows (header first) for one workout session's exercises"""
+    rows = [EXERCISE_COLUMNS]
+    for exercise in session.get("exercises", []):
+        rows.append([
+            exercise.get("name", ""),
+            _number(exercise.get("sets")),
+            exercise.get("reps", ""),
+            _number(exercise.get("duration_minutes")),
+            exercise.get("notes", ""),
+        ])
+    return rows
+
+
+def exercise_text(session, exercise, day_title=None):
+    """One exercise as a line of prose under its session's (and day's) title"""
+    details = []
+    if exercise.get("sets"):
+        details.append(f"{_number(exercise['sets'])} sets")
+    if exercise.get("reps"):
+        details.append(f"{exercise['reps']} reps")
+    if exercise.get("duration_minutes"):
+        details.append(f"{_number(exercise['duration_minutes'])} min")
+    line = exercise.get("name", "")
+    if details:
+        line += f": {', '.join(details)}"
+    if exercise.get("notes"):
+        line += f". {exercise['notes']}"
+    return f"{_heading(day_title, session_title(session))}\n{line}"
+
+
+def daily_totals(dietary_plan):
+    """Summed calories and macros over every meal item, for the fields any item reports"""
+    totals = {}
+    for meal in dietary_plan.get("meals", []):
+        for item in meal.get("items", []):
+            for field, _ in MACROS:
+                if item.get(field) is not None:
+                    totals[field] = totals.get(field, 0) + item[field]
+    return totals
+
+
+def totals_text(totals):
+    return ", ".join(f"{_number(round(totals[field]))} {unit}" for field, unit in MACROS if field in totals)
+
+
+def _markdown_table(rows):
+    lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * len(rows[0])]
+    lines.extend("| " + " | ".join(cell.replace("|", "/") for cell in row) + " |" for row in rows[1:])
+    return "\n".join(lines)
+
+
+def meal_markdown(meal):
+    parts = [f"#### {meal_title(meal)}"]
+    if meal.get("items"):
+        parts.append(_markdown_table(meal_rows(meal)))
+    if meal.get("notes"):
+        parts.append(meal["notes"])
+    return "\n\n".join(parts)
+
+
+def session_markdown(session):
+    parts = [f"#### {session_title(session)}"]
+    if session.get("exercises"):
+        parts.append(_markdown_table(session_rows(session)))
+    return "\n\n".join(parts)
+
+
+def plan_days(plan):
+    """(title, day) for each day of a multi-day plan; a single-day plan is one day without a title"""
+    if plan.get("days"):
+        return [(day.get("title") or f"Day {day.get('day')}", day) for day in plan["days"]]
+    return [(None, plan)]
+
+
+def _day_meal_markdown(day):
+    meals = [meal for meal in day.get("meals", []) if meal]
+    if not meals:
+        return day.get("meal_plan", "")
+    text = "\n\n".join(meal_markdown(meal) for meal in meals)
+    totals = daily_totals(day)
+    if totals:
+        text += f"\n\n**Daily total:** {totals_text(totals)}"
+    return text
+
+
+def _day_routine_markdown(day):
+    sessions = [session for session in day.get("sessions", []) if session]
+    if not sessions:
+        return day.get("routine", "")
+    return "\n\n".join(session_markdown(session) for session in sessions)
+
+
+def _with_day_headings(plan, render):
+    parts = []
+    for title, day in plan_days(plan):
+        text = render(day)
+        parts.append(f"### {title}\n\n{text}" if title else text)
+    return "\n\n".join(part for part in parts if part)
+
+
+def meal_plan_markdown(dietary_plan):
+    """The meal plan as markdown: one table per meal plus daily totals, under a heading per day"""
+    return _with_day_headings(dietary_plan, _day_meal_markdown)
+
+
+def routine_markdown(fitness_plan):
+    """The exercise routine as markdown: one table per session, under a heading per day"""
+    return _with_day_headings(fitness_plan, _day_routine_markdown)
+
+
+def _heading(day_title, title):
+    return f"{day_title} - {title}" if day_title else title
+
+
+def plan_sections(dietary_plan, fitness_plan):
+    """Q&A retrieval sections straight from plan fields: one per meal and one per exercise.
+
+    Plans kept as raw markdown, on any day, return None for that source, to be split from text instead.
+    """
+    sections = {"meal_plan": None, "routine": None}
+    meals = [
+        {"source": "meal_plan", "heading": _heading(title, meal_title(meal)), "text": meal_markdown(meal)}
+        for title, day in plan_days(dietary_plan)
+        for meal in day.get("meals", [])
+        if meal
+    ]
+    if meals and not any(day.get("meal_plan") for _, day in plan_days(dietary_plan)):
+        sections["meal_plan"] = meals
+    exercises = [
+        {"source": "routine", "heading": _heading(title, session_title(session)),
+         "text": exercise_text(session, exercise, title)}
+        for title, day in plan_days(fitness_plan)
+        for session in day.get("sessions", [])
+        if session
+        for exercise in session.get("exercises", [])
+    ]
+    if exercises and not any(day.get("routine") for _, day in plan_days(fitness_plan)):
+        sections["routine"] = exercises
+    return sections
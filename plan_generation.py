@@ -0,0 +1,458 @@
+import concurrent.futures
+import functools
+import os
+import queue
+import threading
+import time
+
+import catalog
+import metrics
+from context_cache import cached_model
+from llm_calls import MAX_RETRIES, call_agent, stream_agent
+from plan_cache import agent_cache_key
+
+# Seconds to wait for each agent before giving up on its part of the plan
+DEFAULT_AGENT_TIMEOUT = 120
+
+DIETARY_INSTRUCTIONS = [
+    "Consider the user's input, including dietary restrictions, medical conditions, and cultural background.",
+    "For diabetic users, focus on low glycemic index foods and proper meal timing.",
+    "Build meals mainly from the suggested local ingredients and never use the ingredients to avoid.",
+    "For users in rural/kampung areas, suggest recipes using locally grown produce and traditional cooking methods.",
+    "Respect cultural and religious dietary practices relevant to the user's background.",
+    "Suggest a detailed meal plan for the day, including breakfast, lunch, dinner, and snacks.",
+    "Provide specific portion guidance for users with medical conditions like diabetes.",
+    "Provide a brief explanation of why the plan is suited to the user's goals and medical needs.",
+    "Build the meal plan around the daily calorie, macro, fiber and sodium targets in the profile; they are "
+    "already calculated, so use them as given and keep the explanation brief.",
+    "When the profile gives a program day, plan only that menu day and feature the ingredients the outline lists.",
+]
+
+FITNESS_INSTRUCTIONS = [
+    "Provide exercises tailored to the user's goals, age, medical conditions, and living environment.",
+    "For older users, focus on low-impact exercises that improve balance and strength.",
+    "For users with diabetes, suggest appropriate exercise intensity and timing around meals.",
+    "Consider available resources in rural/kampung settings - suggest exercises that don't require gym equipment.",
+    "Include culturally relevant physical activities when appropriate.",
+    "Choose mainly from the suggested exercises, which fit the user's equipment and setting, and never "
+    "include the exercises to avoid.",
+    "Include warm-up, main workout, and cool-down exercises suitable for the user's profile.",
+    "Explain the benefits of each recommended exercise for their specific conditions.",
+    "When the profile gives a program day, plan only that day's workout focus at the intensity of its phase.",
+]
+
+LIST_FIELDS = ("food_allergies", "medical_conditions", "equipment_access", "lifestyle_factors")
+
+PROFILE_DEFAULTS = {
+    "sex": "Other",
+    "ethnicity": "Other",
+    "activity_level": "Moderately Active",
+    "dietary_preferences": "No Restrictions",
+    "food_allergies": ["None"],
+    "fitness_goals": "Stay Fit",
+    "medical_conditions": ["None"],
+    "region": "Other Country",
+    "living_environment": "Urban City",
+    "equipment_access": ["None"],
+    "lifestyle_factors": [],
+    "language": "English",
+    "plan_days": 1,
+}
+
+# Program lengths offered, in days; each day is its own pair of agent calls
+PLAN_LENGTHS = {1: "1 day", 7: "1 week", 28: "4 weeks"}
+
+# Response shapes the agents are asked for; validated by the models in plan_schema
+DIETARY_OUTPUT_FORMAT = (
+    'Respond with only a JSON object, without markdown fences, in this shape: '
+    '{"why_this_plan_works": "...", "meals": [{"name": "Breakfast", "time": "7:00 AM", '
+    '"items": [{"name": "...", "portion": "1 cup", "calories": 250, "protein_g": 10, "carbs_g": 30, '
+    '"fat_g": 8}], "notes": "..."}], "important_considerations": ["..."]}'
+)
+
+FITNESS_OUTPUT_FORMAT = (
+    'Respond with only a JSON object, without markdown fences, in this shape: '
+    '{"sessions": [{"name": "Warm-up", "duration_minutes": 10, "exercises": [{"name": "...", "sets": 3, '
+    '"reps": "12", "duration_minutes": 5, "notes": "benefits and form cues"}]}], "tips": ["..."]}'
+)
+
+# Used when the agent leaves these out
+WHY_THIS_PLAN_WORKS = "Personalized nutrition based on your profile, medical needs, and cultural background"
+
+IMPORTANT_CONSIDERATIONS = [
+    "Hydration: Drink plenty of water throughout the day",
+    "Electrolytes: Monitor sodium, potassium, and magnesium levels",
+    "Fiber: Ensure adequate intake through vegetables and fruits",
+    "Listen to your body: Adjust portion sizes as needed",
+    "For medical conditions: Always consult with your healthcare provider",
+]
+
+PRO_TIPS = [
+    "Track your progress regularly",
+    "Allow proper rest between workouts",
+    "Focus on proper form",
+    "Stay consistent with your routine",
+    "Adapt exercises based on how you feel each day",
+]
+
+# What agno's markdown=True adds to the Q&A agent's system message
+QA_SYSTEM_PROMPT = "Use markdown to format your answers."
+# Plan contexts are only asked about for a while after generation
+QA_CONTEXT_TTL = 15 * 60
+
+# Minimum seconds between streamed UI updates, so redraws don't outpace the tokens
+STREAM_REFRESH_INTERVAL = 0.1
+
+# agno's Agent class, imported on first use so visitors who never generate a plan don't pay for it
+Agent = None
+
+# Shared by every session in the process so concurrent users can't spawn unbounded threads
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", 8))
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="plan-agent")
+
+
+def _agent_class():
+    global Agent
+    if Agent is None:
+        from agno.agent import Agent as agno_agent
+        Agent = agno_agent
+    return Agent
+
+
+@functools.lru_cache(maxsize=None)
+def plan_instructions(kind, language):
+    """Static instructions for the "dietary" or "fitness" agent in a language, assembled once per process"""
+    instructions, output_format = {
+        "dietary": (DIETARY_INSTRUCTIONS, DIETARY_OUTPUT_FORMAT),
+        "fitness": (FITNESS_INSTRUCTIONS, FITNESS_OUTPUT_FORMAT),
+    }[kind]
+    return tuple([f"Provide all responses in {language}."] + instructions + [output_format])
+
+
+@functools.lru_cache(maxsize=None)
+def plan_system_prompt(kind, language):
+    """The instructions rendered as the system message, the static prefix of every plan request"""
+    return "\n".join(f"- {line}" for line in plan_instructions(kind, language))
+
+
+def _plan_agent(model, kind, language, **kwargs):
+    instructions = plan_instructions(kind, language)
+    system_prompt = plan_system_prompt(kind, language)
+    cached = cached_model(model, system_prompt)
+    if cached is not None:
+        # The system message is read from Gemini's context cache, so only the profile is sent.
+        # instructions are still set because plan cache keys are built from them.
+        return _agent_class()(
+            model=cached, instructions=list(instructions), create_default_system_message=False, **kwargs
+        )
+    return _agent_class()(model=model, instructions=list(instructions), system_message=system_prompt, **kwargs)
+
+
+def build_dietary_agent(model, language):
+    """Create the dietary expert agent for the given language"""
+    return _plan_agent(
+        model, "dietary", language, name="Dietary Expert", role="Provides personalized dietary recommendations"
+    )
+
+
+def build_fitness_agent(model, language):
+    """Create the fitness expert agent for the given language"""
+    return _plan_agent(
+        model, "fitness", language, name="Fitness Expert", role="Provides personalized fitness recommendations"
+    )
+
+
+def build_qa_agent(model):
+    """Create the agent that answers follow-up questions about a plan"""
+    return _agent_class()(model=model, show_tool_calls=True, markdown=True)
+
+
+def qa_request(model, context, request):
+    """(agent, prompt) for one Q&A call, from QASession.prompt_parts.
+
+    A plan context long enough for Gemini's context cache is cached along with
+    the Q&A system message, and only the request is sent.
+    """
+    if not context:
+        return build_qa_agent(model), request
+    cached = cached_model(model, f"{QA_SYSTEM_PROMPT}\n\n{context}", ttl=QA_CONTEXT_TTL)
+    if cached is not None:
+        return _agent_class()(model=cached, create_default_system_message=False), request
+    return build_qa_agent(model), f"{context}\n\n{request}"
+
+
+def clean_selection(selected, other=None):
+    """Drop a redundant "None" and swap "Other" for the user's own text"""
+    cleaned = []
+    for item in selected:
+        if item == "None" and len(selected) > 1:
+            continue  # Skip "None" if other options are selected
+        elif item == "Other" and other is not None:
+            cleaned.append(other)
+        else:
+            cleaned.append(item)
+    return cleaned
+
+
+def parse_profile(record, line_number=None):
+    """Turn a CSV row or JSON object into a profile dict plus its id.
+
+    Raises ValueError for a missing or mistyped field.
+    """
+    where = f"line {line_number}: " if line_number is not None else ""
+    if not isinstance(record, dict):
+        raise ValueError(f"{where}expected an object of profile fields")
+    profile = dict(PROFILE_DEFAULTS)
+    for field, value in record.items():
+        if value in (None, "") or (field not in PROFILE_DEFAULTS and field not in ("id", "age", "weight", "height")):
+            continue
+        if field in LIST_FIELDS:
+            if isinstance(value, str):
+                # CSV cells hold lists separated by semicolons
+                value = [item.strip() for item in value.split(";") if item.strip()]
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise ValueError(f"{where}{field} must be a list of strings")
+        elif isinstance(PROFILE_DEFAULTS.get(field), str) and not isinstance(value, str):
+            raise ValueError(f"{where}{field} must be a string")
+        profile[field] = value
+    for field, kind in (("age", int), ("weight", float), ("height", float), ("plan_days", int)):
+        if field not in profile:
+            raise ValueError(f"{where}missing required field '{field}'")
+        try:
+            profile[field] = kind(profile[field])
+        except (TypeError, ValueError):
+            raise ValueError(f"{where}{field} must be a number") from None
+    if profile["plan_days"] not in PLAN_LENGTHS:
+        raise ValueError(f"{where}plan_days must be one of {', '.join(map(str, PLAN_LENGTHS))}")
+    profile_id = profile.pop("id", line_number)
+    return (str(profile_id) if profile_id is not None else None), profile
+
+
+def build_user_profile(profile, targets=None):
+    """Render the profile dict, plus its computed nutrition targets, as the text prompt sent to both agents"""
+    from nutrition import profile_targets, targets_prompt  # NumPy is only needed once plans are generated
+
+    targets = targets or profile_targets(profile)
+    target_lines = "".join(f"                    {line}\n" for line in targets_prompt(targets).split("\n"))
+    return f"""
+                    Age: {profile['age']}
+                    Weight: {profile['weight']}kg
+                    Height: {profile['height']}cm
+                    Sex: {profile['sex']}
+                    Ethnicity: {profile['ethnicity']}
+                    Activity Level: {profile['activity_level']}
+                    Dietary Preferences: {profile['dietary_preferences']}
+                    Food Allergies: {', '.join(profile['food_allergies'])}
+                    Fitness Goals: {profile['fitness_goals']}
+                    Medical Conditions: {', '.join(profile['medical_conditions'])}
+                    Region: {profile['region']}
+                    Living Environment: {profile['living_environment']}
+                    Equipment Access: {', '.join(profile['equipment_access'])}
+                    Lifestyle Factors: {', '.join(profile['lifestyle_factors'])}
+                    Preferred Language: {profile['language']}
+{target_lines}                    """
+
+
+def make_dietary_plan(content, partial=False):
+    """Validate the dietary agent output into the plan dict used for display, export and Q&A.
+
+    With partial, content may still be streaming. Output that isn't the requested
+    JSON is kept as markdown in meal_plan.
+    """
+    from plan_schema import DietaryPlan, compact, parse_plan  # pydantic is only needed once plans exist
+
+    parsed = parse_plan(content, DietaryPlan, partial=partial)
+    # JSON with none of the plan's fields is some other answer, kept as text
+    if parsed is None or not (partial or parsed.model_fields_set):
+        return {
+            "why_this_plan_works": WHY_THIS_PLAN_WORKS,
+            "meal_plan": content,
+            "important_considerations": IMPORTANT_CONSIDERATIONS,
+        }
+    plan = compact(parsed)
+    plan.setdefault("why_this_plan_works", WHY_THIS_PLAN_WORKS)
+    plan.setdefault("important_considerations", IMPORTANT_CONSIDERATIONS)
+    return plan
+
+
+def make_fitness_plan(content, profile, partial=False):
+    """Validate the fitness agent output into the plan dict used for display, export and Q&A.
+
+    Output that isn't the requested JSON is kept as markdown in routine.
+    """
+    from plan_schema import FitnessPlan, compact, parse_plan
+
+    goals = profile and (
+        f"Personalized exercise plan for {profile['age']} year old {profile['ethnicity']} "
+        f"{profile['sex'].lower()} with {', '.join(profile['medical_conditions'])} "
+        f"living in {profile['living_environment']}"
+    )
+    parsed = parse_plan(content, FitnessPlan, partial=partial)
+    if parsed is None or not (partial or parsed.model_fields_set):
+        return {"goals": goals, "routine": content, "tips": PRO_TIPS}
+    plan = {"goals": goals, **compact(parsed)}
+    plan.setdefault("tips", PRO_TIPS)
+    return plan
+
+
+def run_agents(agents, prompts, timeouts=None, default_timeout=DEFAULT_AGENT_TIMEOUT, max_retries=MAX_RETRIES):
+    """Run named agents concurrently, each on its prompt in prompts.
+
+    Returns (contents, errors): agent name -> response content for the agents
+    that finished, and agent name -> exception for those that failed or timed out.
+    Each agent's timeout counts from when its call starts rather than when it
+    was queued, so a busy pool doesn't time out work before it runs; the call
+    layer gives up at the deadline, which frees the worker.
+    """
+    timeouts = timeouts or {}
+    futures = {
+        name: _executor.submit(
+            call_agent, agent, prompts[name], stage=f"agent.{name}", timeout=timeouts.get(name, default_timeout),
+            max_retries=max_retries,
+        )
+        for name, agent in agents.items()
+    }
+
+    contents, errors = {}, {}
+    for name, future in futures.items():
+        try:
+            contents[name] = future.result().content
+        except Exception as e:
+            errors[name] = e
+    return contents, errors
+
+
+def _pump_stream(name, agent, prompt, events, timeout, stop, max_retries=MAX_RETRIES):
+    """Forward an agent's streamed chunks to the events queue as (name, kind, value) events.
+
+    The deadline starts when the pump does and is sent first, as a "start"
+    event. Reading stops at the deadline, or once stop is set.
+    """
+    if stop.is_set():
+        return
+    deadline = time.monotonic() + timeout
+    events.put((name, "start", deadline))
+    try:
+        for chunk in stream_agent(
+            agent, prompt, stage=f"agent.{name}", max_retries=max_retries, deadline=deadline, stop=stop
+        ):
+            content = getattr(chunk, "content", None)
+            if isinstance(content, str) and content:
+                events.put((name, "chunk", content))
+    except Exception as e:
+        events.put((name, "error", e))
+    else:
+        events.put((name, "done", None))
+
+
+def stream_agents(agents, prompts, on_chunk, timeouts=None, default_timeout=DEFAULT_AGENT_TIMEOUT,
+                  refresh_interval=STREAM_REFRESH_INTERVAL, max_retries=MAX_RETRIES):
+    """Stream named agents concurrently, each on its prompt in prompts.
+
+    on_chunk(name, text_so_far) is called from the calling thread, at most once
+    per refresh_interval per agent plus once when the agent finishes, so it can
+    safely update Streamlit elements. Returns (contents, errors) like run_agents,
+    with each timeout likewise counted from when its agent starts streaming.
+    """
+    timeouts = timeouts or {}
+    events = queue.Queue()
+    # Set on return, including when on_chunk raises, so no pump keeps reading for a caller that's gone
+    stop = threading.Event()
+    for name, agent in agents.items():
+        _executor.submit(
+            _pump_stream, name, agent, prompts[name], events, timeouts.get(name, default_timeout), stop, max_retries
+        )
+
+    deadlines = {}
+    parts = {name: [] for name in agents}
+    last_refresh = {name: 0.0 for name in agents}
+    dirty = set()
+    contents, errors = {}, {}
+    pending = set(agents)
+    try:
+        while pending:
+            now = time.monotonic()
+            for name in [name for name in pending if name in deadlines and now >= deadlines[name]]:
+                pending.discard(name)
+                errors[name] = TimeoutError(f"{name} agent timed out after {timeouts.get(name, default_timeout)}s")
+            if not pending:
+                break
+
+            # Agents still queued for a worker have no deadline yet
+            started = [deadlines[name] for name in pending if name in deadlines]
+            try:
+                name, kind, value = events.get(timeout=min(started) - now if started else None)
+            except queue.Empty:
+                continue
+            if name not in pending:
+                continue  # Late output from an agent that already timed out
+            if kind == "start":
+                deadlines[name] = value
+            elif kind == "chunk":
+                parts[name].append(value)
+                dirty.add(name)
+            elif kind == "error":
+                pending.discard(name)
+                errors[name] = value
+            else:
+                pending.discard(name)
+                contents[name] = "".join(parts[name])
+                on_chunk(name, contents[name])
+                dirty.discard(name)
+
+            now = time.monotonic()
+            for name in list(dirty):
+                if name in pending and now - last_refresh[name] >= refresh_interval:
+                    on_chunk(name, "".join(parts[name]))
+                    last_refresh[name] = now
+                    dirty.discard(name)
+    finally:
+        stop.set()
+    return contents, errors
+
+
+def generate_plans(dietary_agent, fitness_agent, user_profile, profile, timeouts=None, cache=None,
+                   on_chunk=None, max_retries=MAX_RETRIES):
+    """Generate the dietary and fitness plans side by side.
+
+    Either plan is None if its agent failed, or wasn't given; the matching exception is in errors.
+    With a cache, only the agents whose answer for this profile isn't cached are run.
+    With on_chunk, agent output is streamed to it as described in stream_agents.
+    Each agent also gets its shortlist from the local catalog, and anything in
+    its answer the profile rules out is removed.
+    """
+    agents = {name: agent for name, agent in (("dietary", dietary_agent), ("fitness", fitness_agent)) if agent}
+    contents, keys = {}, {}
+    if cache is not None:
+        for name, agent in agents.items():
+            keys[name] = agent_cache_key(agent, profile)
+            cached = cache.get(keys[name])
+            metrics.count("cache", cache="plan", result="miss" if cached is None else "hit")
+            if cached is not None:
+                contents[name] = cached
+                if on_chunk is not None:
+                    on_chunk(name, cached)
+
+    pending = {name: agent for name, agent in agents.items() if name not in contents}
+    if not pending:
+        fresh, errors = {}, {}
+    else:
+        shortlists = catalog.shortlist_prompts(profile)
+        prompts = {name: f"{user_profile}\n{shortlists[name]}" for name in pending}
+        if on_chunk is not None:
+            fresh, errors = stream_agents(pending, prompts, on_chunk, timeouts=timeouts, max_retries=max_retries)
+        else:
+            fresh, errors = run_agents(pending, prompts, timeouts=timeouts, max_retries=max_retries)
+    if cache is not None:
+        for name, content in fresh.items():
+            cache.set(keys[name], content)
+    contents.update(fresh)
+
+    dietary_plan = fitness_plan = None
+    if "dietary" in contents:
+        dietary_plan, removed = catalog.check_dietary_plan(make_dietary_plan(contents["dietary"]), profile)
+        metrics.count("catalog_removed", removed, agent="dietary")
+    if "fitness" in contents:
+        fitness_plan, removed = catalog.check_fitness_plan(make_fitness_plan(contents["fitness"], profile), profile)
+        metrics.count("catalog_removed", removed, agent="fitness")
+    return dietary_plan, fitness_plan, errors
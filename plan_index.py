@@ -0,0 +1,139 @@
+import re
+
+import numpy as np
+
+from plan_format import plan_sections
+
+# Standard BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Sections longer than this (in words) are split further into their list items
+MAX_SECTION_WORDS = 120
+
+_HEADING = re.compile(r"^\s*(#{1,6}\s+.+|\*\*[^*]+\*\*:?\s*|[^\s].{0,60}:)\s*$")
+_LIST_ITEM = re.compile(r"^(\s{0,3})([-*+•]|\d+[.)])\s+")
+_WORD = re.compile(r"\w+", re.UNICODE)
+# Scripts written without spaces between words; indexed as character bigrams
+_UNSPACED = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def tokenize(text):
+    """Lowercased word tokens, with character unigrams and bigrams for CJK runs"""
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        if _UNSPACED.search(word):
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _split_list_items(heading, lines):
+    """Break an overlong section into one chunk per top-level list item"""
+    chunks, current = [], []
+    for line in lines:
+        match = _LIST_ITEM.match(line)
+        if match and not match.group(1) and current:
+            chunks.append(current)
+            current = []
+        current.append(line)
+    if current:
+        chunks.append(current)
+    return [(heading, chunk) for chunk in chunks]
+
+
+def split_sections(text, source):
+    """Split a markdown plan into sections at its headings.
+
+    Returns dicts with the source plan, the nearest heading and the section
+    text. Long sections (e.g. a main workout with many exercises) are split
+    into one section per list item, each keeping its heading.
+    """
+    raw_sections = []
+    heading, lines = "", []
+    for line in text.split("\n"):
+        if _HEADING.match(line) and not _LIST_ITEM.match(line):
+            if any(part.strip() for part in lines):
+                raw_sections.append((heading, lines))
+            heading, lines = line.strip().strip("#*: ").strip(), []
+        elif line.strip():
+            lines.append(line)
+    if any(part.strip() for part in lines) or heading:
+        raw_sections.append((heading, lines))
+
+    sections = []
+    for heading, lines in raw_sections:
+        if sum(len(line.split()) for line in lines) > MAX_SECTION_WORDS:
+            parts = _split_list_items(heading, lines)
+        else:
+            parts = [(heading, lines)]
+        for part_heading, part_lines in parts:
+            body = "\n".join(part_lines).strip()
+            sections.append({
+                "source": source,
+                "heading": part_heading,
+                "text": f"{part_heading}\n{body}".strip() if part_heading else body,
+            })
+    return sections
+
+
+class PlanIndex:
+    """BM25 index over plan sections, built once and queried per question"""
+
+    def __init__(self, sections, k1=BM25_K1, b=BM25_B):
+        self.sections = sections
+        vocabulary = {}
+        rows = []
+        for section in sections:
+            counts = {}
+            for token in tokenize(section["text"]):
+                term = vocabulary.setdefault(token, len(vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            rows.append(counts)
+        self.vocabulary = vocabulary
+
+        tf = np.zeros((len(sections), len(vocabulary)), dtype=np.float32)
+        for i, counts in enumerate(rows):
+            if counts:
+                tf[i, list(counts)] = list(counts.values())
+        doc_lengths = tf.sum(axis=1)
+        avg_length = doc_lengths.mean() if len(sections) else 0.0
+        doc_freq = (tf > 0).sum(axis=0)
+        idf = np.log1p((len(sections) - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = k1 * (1 - b + b * doc_lengths / max(avg_length, 1e-9))
+        # Term weights are precomputed so a query is a column sum
+        self._weights = (idf * tf * (k1 + 1) / (tf + norm[:, None])).astype(np.float32)
+
+    @classmethod
+    def from_plans(cls, plans):
+        """Index the sections of {source: plan text}"""
+        sections = []
+        for source, text in plans.items():
+            if text:
+                sections.extend(split_sections(text, source))
+        return cls(sections)
+
+    @classmethod
+    def from_plan_fields(cls, dietary_plan, fitness_plan, plans):
+        """Index structured plans by their meals and exercises, splitting any raw markdown plan in plans"""
+        sections = []
+        for source, structured in plan_sections(dietary_plan, fitness_plan).items():
+            if structured is not None:
+                sections.extend(structured)
+            elif plans.get(source):
+                sections.extend(split_sections(plans[source], source))
+        return cls(sections)
+
+    def search(self, query, k=4, sources=None):
+        """Top-k matching sections in plan order, optionally limited to some sources"""
+        terms = [self.vocabulary[token] for token in set(tokenize(query)) if token in self.vocabulary]
+        if not terms or not self.sections:
+            return []
+        scores = self._weights[:, terms].sum(axis=1)
+        if sources is not None:
+            allowed = np.array([section["source"] in sources for section in self.sections])
+            scores = np.where(allowed, scores, 0.0)
+        best = [i for i in np.argsort(-scores, kind="stable")[:k] if scores[i] > 0]
+        return [self.sections[i] for i in sorted(best)]
@@ -0,0 +1,231 @@
+"""Background plan generation jobs.
+
+Generation is submitted to a process-wide worker pool and tracked by job id,
+so a Streamlit rerun, tab switch or websocket reconnect doesn't throw away
+Gemini calls that are already paid for: the page just polls the job again.
+With JOB_STORE_PATH set, job status and results are also kept in SQLite, so
+finished plans can be picked up from another server process.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+from llm_calls import api_key_fingerprint
+from multi_day import generate_program, plan_length
+from plan_cache import get_plan_cache
+from plan_generation import AGENT_WORKERS, build_dietary_agent, build_fitness_agent, build_user_profile, generate_plans
+from resources import get_gemini_model
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = {DONE, FAILED}
+
+# Finished jobs are kept this long for their session to pick up
+DEFAULT_JOB_TTL = 60 * 60
+# Running jobs refresh their stored status this often; one silent for HEARTBEAT_TIMEOUT was lost with its process
+HEARTBEAT_INTERVAL = 5.0
+HEARTBEAT_TIMEOUT = 60.0
+
+
+class Job:
+    """One background generation and its progress so far"""
+
+    def __init__(self, job_id, key=None, status=QUEUED, result=None, error=None, updated=None):
+        self.id = job_id
+        self.key = key
+        self.status = status
+        self.progress = {}
+        self.result = result
+        self.error = error
+        self.updated = updated or time.time()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def report(self, name, text):
+        """on_chunk callback: the text an agent has produced so far"""
+        self.progress[name] = text
+
+
+class SQLiteJobStore:
+    """Job status and results in SQLite, shared by every process using the same file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plan_jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, error TEXT, updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plan_jobs_updated ON plan_jobs (updated)")
+        self._conn.commit()
+
+    def save(self, job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plan_jobs (id, status, result, error, updated) VALUES (?, ?, ?, ?, ?)",
+                (job.id, job.status, json.dumps(job.result, ensure_ascii=False), job.error, job.updated),
+            )
+            self._conn.commit()
+
+    def load(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, result, error, updated FROM plan_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, result, error, updated = row
+        if status not in FINISHED and time.time() - updated > HEARTBEAT_TIMEOUT:
+            status, error = FAILED, "Generation was interrupted, please try again"
+        return Job(job_id, status=status, result=json.loads(result), error=error, updated=updated)
+
+    def expire(self, older_than):
+        with self._lock:
+            self._conn.execute("DELETE FROM plan_jobs WHERE updated < ?", (older_than,))
+            self._conn.commit()
+
+
+class JobQueue:
+    """In-process worker pool running jobs submitted by id, optionally persisted to a store"""
+
+    def __init__(self, workers, store=None, ttl=DEFAULT_JOB_TTL):
+        self.store = store
+        self.ttl = ttl
+        self._jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan-job")
+
+    def submit(self, function, key=None):
+        """Queue function(job), whose return value becomes the job result; returns the job id.
+
+        While a job with the same key is queued or running, its id is returned instead.
+        """
+        with self._lock:
+            self._expire()
+            if key is not None and key in self._in_flight:
+                metrics.count("jobs", result="coalesced")
+                return self._in_flight[key]
+            job = Job(uuid.uuid4().hex, key=key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._in_flight[key] = job.id
+        self._save(job)
+        metrics.count("jobs", result="submitted")
+        self._executor.submit(self._run, job, function)
+        return job.id
+
+    def get(self, job_id):
+        """The job with this id, or None if it is unknown or has expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    def _run(self, job, function):
+        job.status = RUNNING
+        self._save(job)
+        if self.store is not None:
+            threading.Thread(target=self._heartbeat, args=(job,), daemon=True).start()
+        try:
+            with metrics.timed("job"):
+                job.result = function(job)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.updated = time.time()
+            with self._lock:
+                if job.key is not None:
+                    self._in_flight.pop(job.key, None)
+            self._save(job)
+            metrics.count("jobs", result=job.status)
+
+    def _heartbeat(self, job):
+        while not job.finished:
+            time.sleep(HEARTBEAT_INTERVAL)
+            if not job.finished:
+                job.updated = time.time()
+                self._save(job)
+
+    def _save(self, job):
+        if self.store is not None:
+            self.store.save(job)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.updated < cutoff]:
+            del self._jobs[job_id]
+        if self.store is not None:
+            self.store.expire(cutoff)
+
+
+def plan_job_key(api_key, profile):
+    """Jobs for the same API key and profile share one generation while it runs"""
+    payload = json.dumps([api_key_fingerprint(api_key), profile], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def generate_for_profile(api_key, profile, on_chunk=None):
+    """Generate both plans, or a multi-day program, for a profile: (dietary_plan, fitness_plan, user_profile, errors)"""
+    model = get_gemini_model(api_key)
+
+    # Agents keep per-run state, so each generation gets its own pair on the shared model
+    def build_agents():
+        return build_dietary_agent(model, profile["language"]), build_fitness_agent(model, profile["language"])
+
+    with metrics.timed("profile"):
+        user_profile = build_user_profile(profile)
+    if plan_length(profile) > 1:
+        dietary_plan, fitness_plan, errors = generate_program(
+            build_agents, user_profile, profile, cache=get_plan_cache(), on_chunk=on_chunk
+        )
+    else:
+        dietary_plan, fitness_plan, errors = generate_plans(
+            *build_agents(), user_profile, profile, cache=get_plan_cache(), on_chunk=on_chunk
+        )
+    return dietary_plan, fitness_plan, user_profile, errors
+
+
+def submit_plan_job(api_key, profile):
+    """Start generating plans for a profile in the background and return the job id"""
+    def run(job):
+        dietary_plan, fitness_plan, user_profile, errors = generate_for_profile(api_key, profile, job.report)
+        if dietary_plan is None and fitness_plan is None:
+            raise RuntimeError("; ".join(f"{name}: {error}" for name, error in errors.items()))
+        return {
+            "dietary_plan": dietary_plan or {},
+            "fitness_plan": fitness_plan or {},
+            "user_profile": user_profile,
+            "errors": {name: str(error) for name, error in errors.items()},
+        }
+
+    return get_job_queue().submit(run, key=plan_job_key(api_key, profile))
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Process-wide job queue configured from the JOB_* environment variables"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            path = os.environ.get("JOB_STORE_PATH")
+            _job_queue = JobQueue(
+                workers=int(os.environ.get("JOB_WORKERS", max(AGENT_WORKERS // 2, 1))),
+                store=SQLiteJobStore(path) if path else None,
+                ttl=float(os.environ.get("JOB_TTL", DEFAULT_JOB_TTL)),
+            )
+        return _job_queue
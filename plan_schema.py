@@ -0,0 +1,155 @@
+"""Response models for the dietary and fitness agents, and parsing of their (possibly partial) JSON.
+
+Agent output is validated once into these models and kept as their compact
+dict form, so display, export and Q&A read fields instead of re-parsing text.
+Imported on first use: pydantic isn't needed until a plan is generated.
+"""
+import json
+import re
+from typing import Annotated, List, Optional
+
+from pydantic import BaseModel, BeforeValidator, ValidationError
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def _to_number(value):
+    """Accept 250, "250" or "250 kcal"; None when there is no number"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = _NUMBER.search(str(value))
+    return float(match.group()) if match else None
+
+
+def _to_list(value):
+    """Accept a list, a single bare item or null; null items are dropped"""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [item for item in value if item is not None]
+
+
+# Models often write numbers as text ("250 kcal", "3 sets") or reps as numbers
+Number = Annotated[Optional[float], BeforeValidator(_to_number)]
+Text = Annotated[str, BeforeValidator(lambda value: "" if value is None else str(value))]
+
+
+def list_of(item_type):
+    """List field that also takes null, a single bare item, or a list with null entries (dropped)"""
+    return Annotated[List[item_type], BeforeValidator(_to_list)]
+
+
+class FoodItem(BaseModel):
+    name: Text = ""
+    portion: Text = ""
+    calories: Number = None
+    protein_g: Number = None
+    carbs_g: Number = None
+    fat_g: Number = None
+
+
+class Meal(BaseModel):
+    name: Text = ""
+    time: Text = ""
+    items: list_of(FoodItem) = []
+    notes: Text = ""
+
+
+class DietaryPlan(BaseModel):
+    why_this_plan_works: Text = ""
+    meals: list_of(Meal) = []
+    important_considerations: list_of(Text) = []
+
+
+class Exercise(BaseModel):
+    name: Text = ""
+    sets: Number = None
+    reps: Text = ""
+    duration_minutes: Number = None
+    notes: Text = ""
+
+
+class WorkoutSession(BaseModel):
+    name: Text = ""
+    duration_minutes: Number = None
+    exercises: list_of(Exercise) = []
+
+
+class FitnessPlan(BaseModel):
+    sessions: list_of(WorkoutSession) = []
+    tips: list_of(Text) = []
+
+
+def close_partial_json(text):
+    """Best-effort completion of a truncated JSON document, or None if nothing usable has arrived.
+
+    Incomplete trailing values are dropped back to the last complete one and
+    open strings, arrays and objects are closed.
+    """
+    stack = []
+    in_string = escaped = False
+    # (end, open brackets) at each point where the document could be cut and closed
+    cuts = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            cuts.append((i + 1, tuple(stack)))
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            cuts.append((i + 1, tuple(stack)))
+        elif char == ",":
+            cuts.append((i, tuple(stack)))
+    if not cuts:
+        return None
+
+    candidates = []
+    if in_string and not escaped:
+        candidates.append(text + '"' + "".join(reversed(stack)))
+    candidates.append(text + "".join(reversed(stack)))
+    candidates.extend(text[:end] + "".join(reversed(brackets)) for end, brackets in reversed(cuts[-8:]))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_plan(text, model, partial=False):
+    """Validate agent output into model; None if it isn't JSON of that shape.
+
+    With partial, text may be a response still being streamed.
+    """
+    text = _CODE_FENCE.sub("", text or "").strip()
+    start = text.find("{")
+    if start == -1 or text[:start].strip():
+        return None
+    text = text[start:]
+    try:
+        data = close_partial_json(text) if partial else json.loads(text[:text.rfind("}") + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    try:
+        return model.model_validate(data)
+    except ValidationError:
+        return None
+
+
+def compact(plan):
+    """Plain dict of a validated model, without empty fields"""
+    return plan.model_dump(exclude_none=True, exclude_defaults=True)
@@ -0,0 +1,157 @@
+import collections
+import re
+import threading
+
+from plan_format import meal_plan_markdown, routine_markdown
+
+# Rough prompt budgets, in estimated tokens
+CONTEXT_TOKEN_BUDGET = 1500
+HISTORY_TOKEN_BUDGET = 600
+
+# Which parts of the plans each question category needs
+CATEGORY_SOURCES = {
+    "Diet": ("meal_plan",),
+    "Exercise": ("routine",),
+    "Medical Considerations": ("meal_plan", "routine"),
+    "Cultural Adaptations": ("meal_plan", "routine"),
+    "Local Ingredients": ("meal_plan",),
+}
+
+# Categories answered from the top-k matching plan sections rather than whole plans
+RETRIEVAL_CATEGORIES = {"Exercise", "Local Ingredients"}
+RETRIEVAL_TOP_K = 4
+
+SOURCE_LABELS = {"meal_plan": "Dietary Plan", "routine": "Fitness Plan"}
+
+_EMPHASIS = re.compile(r"(\*\*|__|`)")
+_SPACES = re.compile(r"[ \t]+")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate: ~4 ASCII characters per token, one per non-ASCII character"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def compact_text(text, token_budget):
+    """Strip markdown noise and blank lines, then clip to the budget on a line boundary"""
+    lines = []
+    used = 0
+    for line in text.split("\n"):
+        line = _SPACES.sub(" ", _EMPHASIS.sub("", line)).strip()
+        if not line:
+            continue
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            lines.append("…")
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+
+class QASession:
+    """Compact, per-category plan context and a bounded history window for Q&A.
+
+    Built once per plan generation; the compacted context for each category and
+    the section index are computed on first use and reused for every later question.
+    """
+
+    def __init__(self, dietary_plan, fitness_plan, context_token_budget=CONTEXT_TOKEN_BUDGET,
+                 history_token_budget=HISTORY_TOKEN_BUDGET):
+        self.dietary_plan = dietary_plan
+        self.fitness_plan = fitness_plan
+        self.plans = {
+            "meal_plan": meal_plan_markdown(dietary_plan) or "",
+            "routine": routine_markdown(fitness_plan) or "",
+        }
+        self.context_token_budget = context_token_budget
+        self.history_token_budget = history_token_budget
+        self._contexts = {}
+        self._index = None
+
+    @property
+    def index(self):
+        """BM25 index over both plans' meals and exercises"""
+        if self._index is None:
+            from plan_index import PlanIndex  # NumPy is only needed once a question is asked
+            self._index = PlanIndex.from_plan_fields(self.dietary_plan, self.fitness_plan, self.plans)
+        return self._index
+
+    def context_for(self, category):
+        """Plan context relevant to a question category"""
+        if category not in self._contexts:
+            sources = [source for source in CATEGORY_SOURCES.get(category, ("meal_plan", "routine"))
+                       if self.plans[source]]
+            budget = self.context_token_budget // max(len(sources), 1)
+            self._contexts[category] = "\n\n".join(
+                f"{SOURCE_LABELS[source]}:\n{compact_text(self.plans[source], budget)}" for source in sources
+            )
+        return self._contexts[category]
+
+    def retrieved_context_for(self, category, question, k=RETRIEVAL_TOP_K):
+        """Top-k plan sections matching the question, or None if nothing matches"""
+        sources = CATEGORY_SOURCES.get(category, ("meal_plan", "routine"))
+        sections = self.index.search(question, k=k, sources=sources)
+        if not sections:
+            return None
+        budget = self.context_token_budget // len(sections)
+        return "\n\n".join(
+            f"{SOURCE_LABELS[section['source']]} - {compact_text(section['text'], budget)}" for section in sections
+        )
+
+    def history_for(self, qa_pairs):
+        """Most recent Q&A pairs that fit in the history budget, oldest first"""
+        window = []
+        used = 0
+        for question, answer in reversed(qa_pairs):
+            turn = f"Q: {question}\nA: {compact_text(answer, self.history_token_budget // 2)}"
+            cost = estimate_tokens(turn)
+            if used + cost > self.history_token_budget:
+                break
+            window.append(turn)
+            used += cost
+        return "\n\n".join(reversed(window))
+
+    def prompt_parts(self, question, category, qa_pairs=()):
+        """(plan context, request) for one question.
+
+        The context is the same for every question in a category, so it can be
+        cached as a prompt prefix. It is None when sections were retrieved for
+        this question, and they are put in the request instead.
+        """
+        request = ""
+        history = self.history_for(qa_pairs)
+        if history:
+            request += f"Previous Questions:\n{history}\n\n"
+        request += f"Question Category: {category}\nUser Question: {question}"
+        if category in RETRIEVAL_CATEGORIES:
+            retrieved = self.retrieved_context_for(category, question)
+            if retrieved is not None:
+                return None, f"{retrieved}\n\n{request}"
+        return self.context_for(category), request
+
+    def build_prompt(self, question, category, qa_pairs=()):
+        """Prompt for one question: compact plan context, recent history, then the question"""
+        context, request = self.prompt_parts(question, category, qa_pairs)
+        return f"{context}\n\n{request}" if context else request
+
+
+# Q&A sessions kept per process; sessions with the same plans share one
+MAX_CACHED_SESSIONS = 256
+
+_sessions = collections.OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def get_qa_session(version, dietary_plan, fitness_plan):
+    """Shared QASession for a plan version, so its contexts and index live outside session state"""
+    with _sessions_lock:
+        if version in _sessions:
+            _sessions.move_to_end(version)
+            return _sessions[version]
+        session = QASession(dietary_plan, fitness_plan)
+        _sessions[version] = session
+        while len(_sessions) > MAX_CACHED_SESSIONS:
+            _sessions.popitem(last=False)
+        return session
@@ -0,0 +1,64 @@
+import asyncio
+import collections
+import threading
+
+from llm_calls import api_key_fingerprint
+
+MODEL_ID = "gemini-1.5-flash"
+
+# Upper bound on distinct API keys / languages kept alive in one process
+MAX_CACHED_RESOURCES = 64
+
+# agno's Gemini model class, imported on first use
+Gemini = None
+
+_resources = collections.OrderedDict()
+_resources_lock = threading.Lock()
+_event_loop = None
+_nest_asyncio_applied = False
+
+
+def _get_or_create(key, factory):
+    with _resources_lock:
+        if key in _resources:
+            _resources.move_to_end(key)
+            return _resources[key]
+        resource = factory()
+        _resources[key] = resource
+        while len(_resources) > MAX_CACHED_RESOURCES:
+            _resources.popitem(last=False)
+        return resource
+
+
+def _gemini_class():
+    global Gemini
+    if Gemini is None:
+        from agno.models.google import Gemini as agno_gemini
+        Gemini = agno_gemini
+    return Gemini
+
+
+def get_gemini_model(api_key, model_id=MODEL_ID):
+    """Long-lived Gemini model; its HTTP client is created once and reused"""
+    key = ("model", api_key_fingerprint(api_key), model_id)
+    return _get_or_create(key, lambda: _gemini_class()(id=model_id, api_key=api_key))
+
+
+def get_event_loop():
+    """The process-wide event loop, installed as the current loop of the calling thread.
+
+    Streamlit runs each rerun on a fresh script thread; the Gemini client needs
+    a current loop there, so every thread shares this one instead of leaking a
+    new loop per rerun.
+    """
+    global _event_loop, _nest_asyncio_applied
+    with _resources_lock:
+        if _event_loop is None or _event_loop.is_closed():
+            _event_loop = asyncio.new_event_loop()
+        if not _nest_asyncio_applied:
+            # Allow nested event loops; patching asyncio once per process is enough
+            import nest_asyncio
+            nest_asyncio.apply()
+            _nest_asyncio_applied = True
+    asyncio.set_event_loop(_event_loop)
+    return _event_loop
@@ -0,0 +1,206 @@
+"""Off-heap storage for per-session blobs: generated plans and older Q&A history.
+
+Streamlit session state only keeps ids, flags and a bounded window of recent
+Q&A, so its size stays flat however long a user chats. Blobs are stored as
+zlib-compressed JSON, in a byte-bounded in-process LRU (default) or in a
+local SQLite file keyed by session id.
+"""
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_TTL = 6 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Q&A pairs per history page; the newest page is also the in-memory window used for prompts
+QA_PAGE_SIZE = 10
+# Pages kept per session; older ones are dropped
+QA_MAX_PAGES = 50
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class MemorySessionStore:
+    """Compressed blobs in process memory, evicting least recently used past max_bytes or the TTL"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id, name):
+        key = (session_id, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                self._remove(key)
+                return None
+            self._entries[key] = (time.time(), entry[1])
+            self._entries.move_to_end(key)
+        return _unpack(entry[1])
+
+    def put(self, session_id, name, value):
+        key = (session_id, name)
+        blob = _pack(value)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.time(), blob)
+            self.size += len(blob)
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, session_id, name):
+        with self._lock:
+            self._remove((session_id, name))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries), "bytes": self.size}
+
+
+class SQLiteSessionStore:
+    """Compressed blobs in a local SQLite file, expired after the TTL"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_blobs ("
+            "session_id TEXT NOT NULL, name TEXT NOT NULL, value BLOB NOT NULL, accessed REAL NOT NULL, "
+            "PRIMARY KEY (session_id, name))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS session_blobs_accessed ON session_blobs (accessed)")
+        self._conn.commit()
+        self._last_expiry = 0.0
+
+    def get(self, session_id, name):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, accessed FROM session_blobs WHERE session_id = ? AND name = ?", (session_id, name)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            self._conn.execute(
+                "UPDATE session_blobs SET accessed = ? WHERE session_id = ? AND name = ?", (now, session_id, name)
+            )
+            self._conn.commit()
+        return _unpack(row[0])
+
+    def put(self, session_id, name, value):
+        now = time.time()
+        blob = _pack(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session_blobs (session_id, name, value, accessed) VALUES (?, ?, ?, ?)",
+                (session_id, name, blob, now),
+            )
+            # Sweeping expired sessions on every write would be wasted work
+            if now - self._last_expiry > 60:
+                self._conn.execute("DELETE FROM session_blobs WHERE accessed < ?", (now - self.ttl,))
+                self._last_expiry = now
+            self._conn.commit()
+
+    def delete(self, session_id, name):
+        with self._lock:
+            self._conn.execute("DELETE FROM session_blobs WHERE session_id = ? AND name = ?", (session_id, name))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM session_blobs"
+            ).fetchone()
+        return {"backend": "sqlite", "entries": entries, "bytes": size}
+
+
+class QAHistory:
+    """A session's Q&A history: the newest page in memory, full pages in the session store"""
+
+    def __init__(self, session_id, store=None, page_size=QA_PAGE_SIZE, max_pages=QA_MAX_PAGES):
+        self.session_id = session_id
+        self.store = store
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.count = 0
+        self.recent = collections.deque(maxlen=page_size)
+        self._tail = []
+
+    def __len__(self):
+        return self.count
+
+    def _store(self):
+        return self.store if self.store is not None else get_session_store()
+
+    def append(self, question, answer):
+        self.recent.append((question, answer))
+        self._tail.append((question, answer))
+        self.count += 1
+        if len(self._tail) == self.page_size:
+            page = self.count // self.page_size - 1
+            self._store().put(self.session_id, f"qa_page:{page}", self._tail)
+            if page >= self.max_pages:
+                self._store().delete(self.session_id, f"qa_page:{page - self.max_pages}")
+            self._tail = []
+
+    @property
+    def pages(self):
+        return -(-self.count // self.page_size)
+
+    @property
+    def first_page(self):
+        """Oldest page still kept: append keeps the newest max_pages full pages, plus the page in memory"""
+        return max(0, self.count // self.page_size - self.max_pages)
+
+    def page(self, number):
+        """Q&A pairs on a page, numbered from 0 (oldest); [] if it has expired"""
+        if number == self.count // self.page_size:
+            return list(self._tail)
+        pairs = self._store().get(self.session_id, f"qa_page:{number}")
+        return [tuple(pair) for pair in pairs or ()]
+
+    def clear(self):
+        for number in range(self.first_page, self.count // self.page_size):
+            self._store().delete(self.session_id, f"qa_page:{number}")
+        self.count = 0
+        self.recent.clear()
+        self._tail = []
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Process-wide session store configured from the SESSION_STORE_* environment variables"""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            ttl = float(os.environ.get("SESSION_STORE_TTL", DEFAULT_TTL))
+            if os.environ.get("SESSION_STORE_BACKEND", "memory") == "sqlite":
+                path = os.environ.get("SESSION_STORE_PATH", "session_store.sqlite3")
+                _session_store = SQLiteSessionStore(path, ttl=ttl)
+            else:
+                max_bytes = int(os.environ.get("SESSION_STORE_MAX_BYTES", DEFAULT_MAX_BYTES))
+                _session_store = MemorySessionStore(max_bytes=max_bytes, ttl=ttl)
+        return _session_store